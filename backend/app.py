@@ -1,15 +1,25 @@
+import asyncio
+import json
+import logging
 import os
 import re
-from difflib import get_close_matches
-from unicodedata import normalize
-from typing import Any, Dict, List, Set, Optional
-from fastapi import FastAPI, HTTPException
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Set, Optional
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 # ⚠️ on n'importe PAS le retriever ici (trop lourd) → import lazy plus bas
 # from retrievers.multi_qdrant_retriever import MultiQdrantRetriever
-from llm.generator import generate_answer  # OK (léger)
+from llm import generator as llm_generator
+from llm.generator import StreamInterrupted, agenerate_answer, astream_answer, is_fallback_answer  # OK (léger)
+from common.answer_cache import AnswerCache
+from common.context_packer import pack_contexts
+from common.fuzzy import FuzzyIndex, text_tokens
+from common.text import tokenize as _tokenize, trim_text
 
 try:
     from dotenv import load_dotenv
@@ -40,6 +50,15 @@ SPECIALTY_PATTERNS = [
     "tes domaines", "dans quoi es-tu spécialisé", "specialite", "spécialité",
 ]
 
+# Intents compilés une fois à l'import : testés avant tout chargement du retriever.
+# Ponctuation finale tolérée, espace compris (« Bonjour ! »).
+_GREETING_RE = re.compile(
+    "(?:" + "|".join(re.escape(g) for g in sorted(GREETINGS, key=len, reverse=True)) + r")[\s!?.]*"
+)
+_SPECIALTY_RE = re.compile(
+    "|".join(re.escape(p) for p in sorted(SPECIALTY_PATTERNS, key=len, reverse=True))
+)
+
 DOMAIN_LABELS = {
     "all": "Tous domaines",
     "farmlink_sols": "Sols & fertilisation",
@@ -81,19 +100,36 @@ _COLLECTION_SUFFIXES = {
     "farmlink_meca": "MECA",
 }
 
+# ===== Gating de confiance =====
+# Sans contexte exploitable, réponse locale (aucun appel LLM) qui suggère un autre domaine.
+CONFIDENCE_GATING = os.getenv("CONFIDENCE_GATING", "1").strip() != "0"
+# Cosinus minimal d'un contexte (-1 : aucun filtre), surchargé par collection
+# via RETRIEVAL_MIN_SCORE_<SUFFIXE> (SOL, CULT, EAU, MECA, MARCHE).
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "-1"))
+_MIN_SCORES = {
+    collection: float(os.getenv(f"RETRIEVAL_MIN_SCORE_{suffix}") or RETRIEVAL_MIN_SCORE)
+    for collection, suffix in _COLLECTION_SUFFIXES.items()
+}
+# Part minimale des mots clés de la question retrouvés dans les contextes (0 : au moins un)
+RETRIEVAL_MIN_COVERAGE = float(os.getenv("RETRIEVAL_MIN_COVERAGE", "0"))
+gating_logger = logging.getLogger("farmlink.gating")
+_gating_stats: Dict[str, Any] = {"checked": 0, "gated": 0, "reasons": {}}
+# Compteurs exposés dans /stats (gating, packing des contextes)
+_stats_lock = threading.Lock()
+
+# ===== Packing des contextes du prompt =====
+# Chunks voisins d'un même document fusionnés (chevauchement écrit une fois), puis budget
+# de tokens rempli par pertinence. CONTEXT_TOKEN_BUDGET=0 : fusion seule, sans limite.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Estimation des tokens Mistral à partir des caractères (pas de tokenizer hors ligne)
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "4"))
+_packing_stats: Dict[str, int] = {
+    "requests": 0, "tokens_before": 0, "tokens_after": 0, "merged": 0, "dropped": 0,
+}
+
 # Limite d’affichage des sources dans la réponse
 MAX_SOURCES = 3
-
-_WORD_RE = re.compile(r"[a-z0-9]{3,}")
-
-def _normalize_text(value: str) -> str:
-    """Return a lowercase ASCII-only version of the input."""
-    normalized = normalize("NFKD", (value or ""))
-    return normalized.encode("ascii", "ignore").decode("ascii").lower()
-
-def _tokenize(value: str) -> List[str]:
-    """Tokenize text for simple keyword coverage checks."""
-    return _WORD_RE.findall(_normalize_text(value))
+_SOURCES_RE = re.compile(r"(?i)\bsources?\s*:")
 
 def _missing_keywords(question: str, contexts: List[Dict], cutoff: float = 0.82) -> List[str]:
     """Identify question keywords that are absent from retrieved contexts."""
@@ -101,24 +137,48 @@ def _missing_keywords(question: str, contexts: List[Dict], cutoff: float = 0.82)
     if not query_tokens or not contexts:
         return query_tokens if query_tokens and not contexts else []
 
-    context_tokens: Set[str] = set()
-    for ctx in contexts:
-        context_tokens.update(_tokenize(ctx.get("text", "")))
-        context_tokens.update(_tokenize(ctx.get("title", "")))
-
-    if not context_tokens:
+    # Mêmes verdicts que difflib.get_close_matches, sans parcourir tout le vocabulaire
+    index = FuzzyIndex([_context_tokens(ctx) for ctx in contexts])
+    if not index.tokens:
         return query_tokens
 
-    vocab = list(context_tokens)
     missing: List[str] = []
     for token in query_tokens:
-        if token in context_tokens:
+        if token in index:
             continue
-        if get_close_matches(token, vocab, n=1, cutoff=cutoff):
+        if index.has_close_match(token, cutoff):
             continue
         missing.append(token)
     return missing
 
+def _context_tokens(ctx: Dict) -> FrozenSet[str]:
+    # Mots du texte qui part réellement dans le prompt (l'extrait en mode snippet), pas ceux
+    # du chunk entier : sinon le gating validerait des mots clés que Mistral ne voit pas.
+    return text_tokens(ctx.get("text", "")) | text_tokens(ctx.get("title", ""))
+
+def _similarity(ctx: Dict) -> Optional[float]:
+    """Cosinus du contexte ; en hybride `score` est le RRF et le cosinus est dans `dense_score`."""
+    if "dense_score" in ctx or "sparse_score" in ctx:
+        return ctx.get("dense_score")  # None : trouvé par BM25 seul
+    return ctx.get("score")
+
+def _min_score(collection: str) -> float:
+    return _MIN_SCORES.get(collection, RETRIEVAL_MIN_SCORE)
+
+def _is_confident(ctx: Dict) -> bool:
+    score = _similarity(ctx)
+    # Un hit BM25 seul partage forcément des mots avec la question : c'est la couverture qui tranche
+    return score is None or score >= _min_score(ctx.get("collection", ""))
+
+def _best_scores(contexts: List[Dict]) -> Dict[str, float]:
+    best: Dict[str, float] = {}
+    for ctx in contexts:
+        score = _similarity(ctx)
+        collection = ctx.get("collection")
+        if score is not None and collection and score > best.get(collection, -2.0):
+            best[collection] = float(score)
+    return best
+
 def _infer_domain(question: str) -> Optional[str]:
     """Heuristique simple pour deviner le domaine si l'utilisateur n'en choisit pas."""
     tokens = set(_tokenize(question))
@@ -163,9 +223,85 @@ def _filter_endpoints(raw: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str
         active[name] = {"url": url, "api_key": api_key}
     return active
 
+def _local_snapshot_domains() -> Set[str]:
+    # Même règle que le retriever : LOCAL_INDEX_MODE=fallback|primary, un dossier par collection
+    mode = (os.getenv("LOCAL_INDEX_MODE") or "off").strip().lower()
+    if mode not in ("fallback", "primary"):
+        return set()
+    default_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "index")
+    root = os.getenv("LOCAL_INDEX_DIR") or default_root
+    if not os.path.isdir(root):
+        return set()
+    return {name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, "vectors.npy"))}
+
+def configured_domains() -> Set[str]:
+    """
+    Domaines interrogeables, lus dans la configuration (variables QDRANT_*, snapshots locaux) :
+    aucun import lourd. Une fois le retriever chargé, on s'en remet à ses collections actives.
+    """
+    global _endpoints_cache, _configured_domains
+    if _retriever is not None:
+        return set(getattr(_retriever, "available_collections", []))
+    if _configured_domains is None:
+        if _endpoints_cache is None:
+            _endpoints_cache = _filter_endpoints(_raw_endpoints())
+        _configured_domains = set(_endpoints_cache) | _local_snapshot_domains()
+    return _configured_domains
+
+def _intent_response(q: "QueryIn") -> Optional[Dict[str, Any]]:
+    """Salutations et questions “meta” : réponse immédiate, sans modèle ni Qdrant."""
+    question_clean = q.question.strip().lower()
+
+    # 1) Salutations ?
+    if _GREETING_RE.fullmatch(question_clean):
+        return {
+            "answer": (
+                "Bonjour ! Je suis FarmLink, ton copilote agricole. "
+                "N'hésite pas à me poser une question sur les sols, les cultures, "
+                "l'irrigation, la mécanisation ou les politiques agricoles."
+            ),
+            "contexts": []
+        }
+
+    # 2) “Tu es spécialisé en quoi ?” → réponse meta, sans RAG
+    if _SPECIALTY_RE.search(question_clean):
+        if q.domain != "all":
+            actif = DOMAIN_LABELS.get(q.domain, q.domain)
+            answer = (
+                f"Je suis FarmLink, assistant RAG agricole.\n"
+                f"Actuellement, je suis **réglé sur** : **{actif}**.\n"
+                "Je réponds uniquement aux questions liées à ce domaine."
+            )
+        else:
+            answer = (
+                "Je suis FarmLink, assistant RAG agricole. Domaines couverts :\n"
+                "• Sols & fertilisation\n• Cultures vivrières\n• Irrigation & eau\n"
+                "• Mécanisation & innovation\n• Politiques & marchés\n\n"
+                "Choisis un domaine ou pose ta question."
+            )
+        return {"answer": answer, "contexts": []}
+    return None
+
+def _check_domain(q: "QueryIn", available: Set[str]) -> None:
+    if q.domain != "all" and q.domain not in available:
+        raise HTTPException(status_code=400, detail=f"Unknown domain '{q.domain}'")
+
+# ===== Cache des réponses complètes =====
+# Clé : (question normalisée, domaine, top_k, tranche de température).
+# ANSWER_CACHE_SIM_THRESHOLD > 0 active la recherche de paraphrases (cosinus).
+answer_cache = AnswerCache(
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIM_THRESHOLD", "0")),
+    temperature_step=float(os.getenv("ANSWER_CACHE_TEMP_STEP", "0.1")),
+)
+ADMIN_TOKEN = (os.getenv("ADMIN_TOKEN") or "").strip()
+
 # ===== Lazy init du retriever =====
 _retriever: Any = None
 _endpoints_cache: Dict[str, Dict[str, str]] | None = None
+_configured_domains: Set[str] | None = None
+_retriever_lock = threading.Lock()
 
 def get_retriever():
     """
@@ -176,21 +312,85 @@ def get_retriever():
     if _retriever is not None:
         return _retriever
 
-    # import LOURD ici, pas au module
-    from retrievers.multi_qdrant_retriever import MultiQdrantRetriever
+    # Plusieurs requêtes concurrentes peuvent arriver pendant le chargement
+    with _retriever_lock:
+        if _retriever is not None:
+            return _retriever
+
+        # import LOURD ici, pas au module
+        from retrievers.multi_qdrant_retriever import MultiQdrantRetriever
 
-    if _endpoints_cache is None:
-        _endpoints_cache = _filter_endpoints(_raw_endpoints())
+        if _endpoints_cache is None:
+            _endpoints_cache = _filter_endpoints(_raw_endpoints())
 
-    _retriever = MultiQdrantRetriever(_endpoints_cache or {})
+        _retriever = MultiQdrantRetriever(_endpoints_cache or {})
     return _retriever
 
+# ===== Préchauffage au démarrage =====
+# RETRIEVER_PRELOAD=1 (défaut) : le modèle et les clients Qdrant se chargent dans un
+# thread dès le démarrage ; /health répond tout de suite, /ready passe à 200 une fois prêt.
+PRELOAD_RETRIEVER = os.getenv("RETRIEVER_PRELOAD", "1").strip() != "0"
+_warmup: Dict[str, Any] = {"state": "idle"}
+
+def _warm_up() -> None:
+    _warmup.update(state="loading", started_at=time.time())
+    t0 = time.perf_counter()
+    try:
+        import retrievers.multi_qdrant_retriever  # noqa: F401 - import lourd (qdrant, numpy)
+        t1 = time.perf_counter()
+        retriever = get_retriever()
+        t2 = time.perf_counter()
+        retriever.model.encode("bonjour")  # premier forward pass (allocations, kernels)
+        t3 = time.perf_counter()
+    except Exception as exc:  # pragma: no cover - dépend de l'environnement
+        _warmup.update(state="error", error=f"{exc.__class__.__name__}: {exc}")
+        return
+    timings = {
+        "import_s": round(t1 - t0, 3),
+        "init_s": round(t2 - t1, 3),
+        "first_encode_s": round(t3 - t2, 3),
+    }
+
+    # Étapes optionnelles : un échec dégrade le service sans le rendre indisponible
+    degraded: Dict[str, str] = {}
+    if getattr(retriever, "reranker", None) is not None:
+        try:
+            retriever.reranker.scorer.predict([("bonjour", "bonjour")])  # idem pour le cross-encoder
+        except Exception as exc:  # pragma: no cover - dépend de l'environnement
+            # Cross-encoder inutilisable : classement dense seul plutôt que des requêtes en erreur
+            retriever.reranker = None
+            degraded["reranker"] = f"{exc.__class__.__name__}: {exc}"
+            logging.getLogger("farmlink.warmup").warning("Reranker warm-up failed, rerank disabled: %s", exc)
+    t4 = time.perf_counter()
+    _warmup.update(
+        state="degraded" if degraded else "ready",
+        **timings,
+        total_s=round(t4 - t0, 3),
+    )
+    if degraded:
+        _warmup["degraded"] = degraded
+
+async def aget_retriever():
+    # Le premier chargement (modèle + clients) se fait hors de la boucle d'événements
+    if _retriever is not None:
+        return _retriever
+    return await run_in_threadpool(get_retriever)
+
 # ===== Modèles =====
 class QueryIn(BaseModel):
     question: str
     domain: str = "all"
     top_k: int = 4
     temperature: float = 0.2
+    # Tronque le texte des contextes renvoyés (pas celui du prompt) : réponses plus légères
+    context_chars: Optional[int] = None
+
+class BatchQueryIn(BaseModel):
+    items: List[QueryIn]
+
+# Limites de /query/batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "64"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
 
 # ===== Utils =====
 def _short_sources(contexts: List[Dict], limit: int = MAX_SOURCES) -> List[str]:
@@ -207,9 +407,13 @@ def root():
         "name": "FarmLink API",
         "status": "ok",
         "health": "/health",
+        "ready": "/ready",
         "docs": "/docs",
         "domains": "/domains",
+        "stats": "/stats",
         "query": {"path": "/query", "method": "POST"},
+        "query_stream": {"path": "/query/stream", "method": "POST"},
+        "query_batch": {"path": "/query/batch", "method": "POST"},
     }
 
 @app.get("/health")
@@ -217,101 +421,512 @@ def health():
     # Ne déclenche pas le chargement du modèle → réponse instantanée
     return {"ok": True}
 
+@app.get("/stats")
+def stats():
+    # Compteurs de cache ; ne force pas le chargement du retriever
+    out: Dict[str, Any] = {
+        "answer_cache": answer_cache.stats(),
+        "llm_http": llm_generator.http_stats(),
+        "gating": gating_stats(),
+        "context_packing": packing_stats(),
+    }
+    if _retriever is None:
+        return {"retriever_loaded": False, **out}
+    return {"retriever_loaded": True, **out, **_retriever.stats()}
+
+@app.post("/cache/invalidate")
+def invalidate_cache(collection: Optional[str] = None, x_admin_token: Optional[str] = Header(default=None)):
+    # Appelé après une ré-ingestion (voir ingest/ingest_qdrant.py --api-url)
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    removed = answer_cache.invalidate(collection)
+    return {"invalidated": removed, "collection": collection or "all"}
+
 @app.get("/domains")
 def domains():
-    # essaie d'utiliser le retriever, mais si endpoints vides renvoie quand même "all"
-    try:
-        r = get_retriever()
-        domain_list = getattr(r, "available_collections", [])
-    except Exception:
-        domain_list = []
-    if domain_list:
-        domain_list = domain_list + ["all"]
+    # Lu dans la configuration : ne force pas le chargement du retriever ; toujours "all"
+    if _retriever is not None:
+        domain_list = list(getattr(_retriever, "available_collections", []))
     else:
-        domain_list = ["all"]
-    return {"domains": domain_list}
-
-@app.post("/query")
-def query(q: QueryIn):
-    retriever = get_retriever()  # le modèle est (lazily) chargé ici
-
-    available = set(getattr(retriever, "available_collections", []))
-    if q.domain != "all" and q.domain not in available:
-        raise HTTPException(status_code=400, detail=f"Unknown domain '{q.domain}'")
-
-    question_clean = q.question.strip().lower()
-
-    # 1) Salutations ?
-    if question_clean in GREETINGS or question_clean.rstrip('!?.') in GREETINGS:
-        return {
-            "answer": (
-                "Bonjour ! Je suis FarmLink, ton copilote agricole. "
-                "N'hésite pas à me poser une question sur les sols, les cultures, "
-                "l'irrigation, la mécanisation ou les politiques agricoles."
-            ),
-            "contexts": []
-        }
-
-    # 2) “Tu es spécialisé en quoi ?” → réponse meta, sans RAG
-    if any(p in question_clean for p in SPECIALTY_PATTERNS):
-        if q.domain != "all":
-            actif = DOMAIN_LABELS.get(q.domain, q.domain)
-            answer = (
-                f"Je suis FarmLink, assistant RAG agricole.\n"
-                f"Actuellement, je suis **réglé sur** : **{actif}**.\n"
-                "Je réponds uniquement aux questions liées à ce domaine."
-            )
-        else:
-            answer = (
-                "Je suis FarmLink, assistant RAG agricole. Domaines couverts :\n"
-                "• Sols & fertilisation\n• Cultures vivrières\n• Irrigation & eau\n"
-                "• Mécanisation & innovation\n• Politiques & marchés\n\n"
-                "Choisis un domaine ou pose ta question."
-            )
-        return {"answer": answer, "contexts": []}
+        domain_list = sorted(configured_domains())
+    return {"domains": domain_list + ["all"]}
+
+@app.on_event("startup")
+async def startup():
+    if PRELOAD_RETRIEVER:
+        threading.Thread(target=_warm_up, name="retriever-warmup", daemon=True).start()
+
+@app.get("/ready")
+def ready():
+    # Sonde de disponibilité (healthCheckPath de render.yaml) : 503 tant que le retriever n'est pas utilisable
+    warmup = dict(_warmup)
+    if PRELOAD_RETRIEVER:
+        is_ready = _retriever is not None and warmup["state"] in ("ready", "degraded")
+    else:
+        # RETRIEVER_PRELOAD=0 : chargement à la première requête, rien à attendre ici
+        is_ready = True
+        if _retriever is None:
+            warmup["state"] = "lazy"
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "warmup": warmup},
+    )
 
-    # 3) RAG normal
-    search_domain = q.domain
+@app.on_event("shutdown")
+async def shutdown():
+    await llm_generator.aclose()
+    if _retriever is not None:
+        await _retriever.aclose()
+
+async def _route_query(
+    q: QueryIn,
+    retriever: Any,
+    available: Set[str],
+    query_vector: Optional[List[float]] = None,
+) -> Dict[str, Any]:
+    """
+    Tout ce qui précède la recherche et suit les intents : cache, choix du domaine.
+    Renvoie {"response": ...} quand la réponse est connue sans RAG.
+    """
+    # Collections réellement ouvertes (un client a pu échouer depuis la configuration)
+    _check_domain(q, available)
+
+    # 3) Cache des réponses (exact puis, si activé, sémantique)
+    cache_key = answer_cache.make_key(q.question, q.domain, q.top_k, q.temperature)
+    if answer_cache.semantic and query_vector is None:
+        query_vector = await retriever.aembed(q.question)
+    # Vecteur déjà calculé (lot, cache sémantique, routeur) : la recherche ne réencode pas la question
+    search_vector = query_vector
+    if not answer_cache.semantic:
+        query_vector = None
+    cached = answer_cache.get(cache_key, query_vector)
+    if cached is not None:
+        response, kind = cached
+        response["cache"] = kind
+        return {"response": response}
+
+    # 4) RAG normal
+    search_domain: Any = q.domain
     inferred_domain = None
+    searched = [q.domain] if q.domain in available else sorted(available)
     if q.domain == "all":
         inferred_domain = _infer_domain(q.question)
         if inferred_domain and inferred_domain in available:
             search_domain = inferred_domain
+            searched = [inferred_domain]
+        else:
+            inferred_domain = None
+            # Pas de mot clé : routeur par centroïdes, sur le vecteur que la recherche réutilisera
+            if search_vector is None:
+                search_vector = await retriever.aembed(q.question)
+            routed = retriever.route_domains(search_vector)
+            if routed and len(routed) == 1:
+                search_domain = inferred_domain = routed[0]
+                searched = list(routed)
+            elif routed:
+                search_domain = searched = list(routed)
+
+    return {
+        "cache_key": cache_key,
+        "query_vector": query_vector,
+        "search_vector": search_vector,
+        "search_domain": search_domain,
+        "inferred_domain": inferred_domain,
+        "searched": searched,
+    }
+
+def _plan_from_hits(
+    q: QueryIn,
+    route: Dict[str, Any],
+    contexts: List[Dict],
+    skipped: Dict[str, str],
+) -> Dict[str, Any]:
+    """Filtre les contextes retrouvés et construit le prompt."""
+    search_domain = route["search_domain"]
+    inferred_domain = route["inferred_domain"]
 
-    contexts = retriever.search(q.question, top_k=q.top_k, domain=search_domain)
+    retrieved = contexts
+    if CONFIDENCE_GATING:
+        # Seuils de score par collection : les contextes trop lointains ne vont pas au prompt
+        contexts = [c for c in contexts if _is_confident(c)]
 
     # Heuristique: si aucun mot de la question ne se retrouve dans le contexte → vide
     missing_keywords = _missing_keywords(q.question, contexts)
     question_tokens = _tokenize(q.question)
+    coverage = 1 - len(missing_keywords) / len(question_tokens) if question_tokens else 1.0
     contexts_for_prompt = contexts
     if contexts and question_tokens and len(missing_keywords) == len(question_tokens):
         contexts_for_prompt = []
         contexts = []
+    elif CONFIDENCE_GATING and contexts and coverage < RETRIEVAL_MIN_COVERAGE:
+        contexts_for_prompt = []
+        contexts = []
+
+    gate = None
+    if CONFIDENCE_GATING and not contexts:
+        if skipped and not retrieved:
+            reason = "unavailable"
+        elif not retrieved:
+            reason = "no_hits"
+        elif not any(_is_confident(c) for c in retrieved):
+            reason = "low_score"
+        else:
+            reason = "keywords"
+        gate = {
+            "reason": reason,
+            "best_scores": _best_scores(retrieved),
+            "coverage": round(coverage, 3),
+            "missing_keywords": missing_keywords,
+        }
 
-    effective_domain = search_domain if search_domain != "all" else (inferred_domain or q.domain)
+    # Deux collections retenues par le routeur : pas de libellé de domaine unique
+    if isinstance(search_domain, str) and search_domain != "all":
+        effective_domain = search_domain
+    else:
+        effective_domain = inferred_domain or q.domain
     domain_label = DOMAIN_LABELS.get(effective_domain) if effective_domain and effective_domain != "all" else None
+    packing = None
+    if contexts_for_prompt:
+        contexts_for_prompt, packing = pack_contexts(
+            contexts_for_prompt, CONTEXT_TOKEN_BUDGET, PROMPT_CHARS_PER_TOKEN
+        )
+        _record_packing(packing)
     prompt = build_prompt(
         q.question,
         contexts_for_prompt,
         missing_keywords=missing_keywords,
         domain_label=domain_label,
     )
-    answer = generate_answer(prompt, temperature=q.temperature)
 
+    prefix = ""
     if q.domain == "all" and inferred_domain and search_domain == inferred_domain:
         label = DOMAIN_LABELS.get(inferred_domain)
         if label:
-            answer = f"**Domaine ciblé : {label}.**\n\n" + answer
+            prefix = f"**Domaine ciblé : {label}.**\n\n"
 
-    # 4) Si le modèle “oublie” la section sources, on ajoute (max 3 titres)
-    import re as _re
-    if not _re.search(r"(?i)\bsources?\s*:", answer):
-        titles = _short_sources(contexts_for_prompt, MAX_SOURCES)
-        if titles:
-            answer = f"{answer.rstrip()}\n\nSources (contexte FarmLink):\n" + \
-                     "\n".join(f"- {t}" for t in titles)
+    return {
+        **route,
+        "prompt": prompt,
+        "prefix": prefix,
+        "contexts": contexts,
+        "contexts_for_prompt": contexts_for_prompt,
+        "skipped": skipped,
+        "gate": gate,
+        "packing": packing,
+    }
 
-    return {"answer": answer, "contexts": contexts}
+def _record_packing(report: Dict[str, int]) -> None:
+    with _stats_lock:
+        _packing_stats["requests"] += 1
+        for key in ("tokens_before", "tokens_after", "merged", "dropped"):
+            _packing_stats[key] += report[key]
+
+def packing_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out: Dict[str, Any] = dict(_packing_stats)
+    out["tokens_saved"] = out["tokens_before"] - out["tokens_after"]
+    out["budget"] = CONTEXT_TOKEN_BUDGET
+    return out
+
+async def _gated_response(plan: Dict[str, Any], q: QueryIn, retriever: Any) -> Optional[Dict[str, Any]]:
+    """
+    Rien d'exploitable retrouvé : réponse gabarit locale au lieu d'un aller-retour LLM.
+    Le domaine suggéré est la collection non interrogée au meilleur score (au-dessus de son seuil).
+    """
+    gate = plan.get("gate")
+    if gate is None:
+        return None
+    best = dict(gate["best_scores"])
+    searched = set(plan["searched"])
+    suggested = None
+    if gate["reason"] != "unavailable":
+        others = [c for c in getattr(retriever, "available_collections", []) if c not in searched]
+        if others:
+            # Top-1 sans payload par collection, sur le vecteur de la question déjà calculé
+            best.update(await retriever.abest_scores(q.question, others, vector=plan.get("search_vector")))
+        candidates = [c for c in best if c not in searched and best[c] >= _min_score(c)]
+        suggested = max(candidates, key=best.get) if candidates else None
+
+    answer = plan["prefix"] + _not_covered_answer(gate, suggested)
+    _record_gating(q, plan, gate, best, suggested)
+    extra = {"suggested_domain": suggested} if suggested else {}
+    # Seul un verdict sur des hits réels (scores, mots-clés) se met en cache : « aucun résultat »
+    # peut venir d'une collection momentanément injoignable et ne doit pas durer tout le TTL.
+    cacheable = gate["reason"] in ("low_score", "keywords")
+    return _finalize_response({**plan, "contexts": []}, answer, cacheable=cacheable, **extra)
+
+def _not_covered_answer(gate: Dict[str, Any], suggested: Optional[str]) -> str:
+    if gate["reason"] == "unavailable":
+        return (
+            "Les documents FarmLink de ce domaine sont momentanément indisponibles. "
+            "Réessaie dans un instant."
+        )
+    text = "Le corpus FarmLink ne couvre pas cette question."
+    missing = gate["missing_keywords"]
+    if gate["reason"] == "keywords" and missing:
+        text += f" Aucun document ne parle de : {', '.join(sorted(set(missing)))}."
+    if suggested:
+        label = DOMAIN_LABELS.get(suggested, suggested)
+        text += f"\n\nEssaie le domaine **{label}**, qui contient des documents plus proches de ta question."
+    else:
+        text += (
+            "\n\nReformule en précisant la culture, la pratique ou la région concernée. Domaines couverts : "
+            "Sols & fertilisation, Cultures vivrières, Irrigation & eau, "
+            "Mécanisation & innovation, Politiques & marchés."
+        )
+    return text
+
+def _record_gating(
+    q: QueryIn,
+    plan: Dict[str, Any],
+    gate: Dict[str, Any],
+    best: Dict[str, float],
+    suggested: Optional[str],
+) -> None:
+    # Journal des décisions : de quoi régler RETRIEVAL_MIN_SCORE_* à partir du trafic réel
+    with _stats_lock:
+        _gating_stats["gated"] += 1
+        _gating_stats["reasons"][gate["reason"]] = _gating_stats["reasons"].get(gate["reason"], 0) + 1
+    gating_logger.info(
+        "gated reason=%s domain=%s searched=%s best=%s thresholds=%s coverage=%.2f suggested=%s question=%r",
+        gate["reason"],
+        q.domain,
+        ",".join(plan["searched"]),
+        {c: round(v, 4) for c, v in best.items()},
+        {c: _min_score(c) for c in best},
+        gate["coverage"],
+        suggested,
+        q.question[:200],
+    )
+
+def _log_gate_check(q: QueryIn, plan: Dict[str, Any]) -> None:
+    with _stats_lock:
+        _gating_stats["checked"] += 1
+    if plan.get("gate") is None and gating_logger.isEnabledFor(logging.DEBUG):
+        gating_logger.debug(
+            "passed domain=%s best=%s contexts=%d question=%r",
+            q.domain,
+            {c: round(v, 4) for c, v in _best_scores(plan["contexts"]).items()},
+            len(plan["contexts"]),
+            q.question[:200],
+        )
+
+def gating_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        return {
+            "enabled": CONFIDENCE_GATING,
+            "checked": _gating_stats["checked"],
+            "gated": _gating_stats["gated"],
+            "reasons": dict(_gating_stats["reasons"]),
+            "min_score": dict(_MIN_SCORES),
+            "min_coverage": RETRIEVAL_MIN_COVERAGE,
+        }
+
+async def _prepare_query(q: QueryIn) -> Dict[str, Any]:
+    """
+    Étapes communes à /query et /query/stream jusqu'au prompt.
+    Renvoie {"response": ...} quand la réponse est connue sans LLM.
+    """
+    # Validation et intents avant tout chargement : un "bonjour" à froid reste instantané
+    _check_domain(q, configured_domains())
+    canned = _intent_response(q)
+    if canned is not None:
+        return {"response": canned}
+
+    retriever = await aget_retriever()  # le modèle est (lazily) chargé ici
+    available = set(getattr(retriever, "available_collections", []))
+
+    route = await _route_query(q, retriever, available)
+    if "response" in route:
+        return route
+
+    # Fan-out concurrent : une collection lente ou en erreur est ignorée et signalée
+    contexts, skipped = await retriever.asearch_with_status(
+        q.question, top_k=q.top_k, domain=route["search_domain"], vector=route["search_vector"]
+    )
+    plan = _plan_from_hits(q, route, contexts, skipped)
+    _log_gate_check(q, plan)
+    gated = await _gated_response(plan, q, retriever)
+    if gated is not None:
+        return {"response": gated}
+    return plan
+
+def _sources_trailer(answer: str, contexts: List[Dict]) -> str:
+    # Si le modèle “oublie” la section sources, on ajoute (max 3 titres)
+    if _SOURCES_RE.search(answer):
+        return ""
+    titles = _short_sources(contexts, MAX_SOURCES)
+    if not titles:
+        return ""
+    return "\n\nSources (contexte FarmLink):\n" + "\n".join(f"- {t}" for t in titles)
+
+def _shape_response(response: Dict[str, Any], q: QueryIn) -> Dict[str, Any]:
+    """Applique ``context_chars`` à la sortie (le cache garde les contextes complets)."""
+    contexts = response.get("contexts")
+    if not q.context_chars or q.context_chars <= 0 or not contexts:
+        return response
+    trimmed = [{**c, "text": trim_text(c.get("text", ""), q.context_chars)} for c in contexts]
+    return {**response, "contexts": trimmed}
+
+def _finalize_response(
+    plan: Dict[str, Any], answer: str, *, cacheable: bool = True, **extra: Any
+) -> Dict[str, Any]:
+    """Réponse finale ; mise en cache seulement si ``cacheable`` (mode hors ligne détecté sur la sortie brute)."""
+    response = {"answer": answer, "contexts": plan["contexts"], **extra}
+    if plan.get("packing"):
+        # Tokens de contexte économisés sur ce prompt (fusion des chevauchements + budget)
+        response["context_packing"] = plan["packing"]
+    if plan["skipped"]:
+        response["skipped_collections"] = plan["skipped"]
+    elif cacheable:
+        # On ne met en cache ni les réponses dégradées ni le mode hors ligne
+        answer_cache.put(plan["cache_key"], response, plan["searched"], plan["query_vector"])
+    return response
+
+async def _answer_plan(plan: Dict[str, Any], temperature: float) -> Dict[str, Any]:
+    raw = await agenerate_answer(plan["prompt"], temperature=temperature)
+    answer = plan["prefix"] + raw
+    trailer = _sources_trailer(answer, plan["contexts_for_prompt"])
+    if trailer:
+        answer = answer.rstrip() + trailer
+    return _finalize_response(plan, answer, cacheable=not is_fallback_answer(raw))
+
+@app.post("/query")
+async def query(q: QueryIn):
+    plan = await _prepare_query(q)
+    if "response" in plan:
+        return _shape_response(plan["response"], q)
+    return _shape_response(await _answer_plan(plan, q.temperature), q)
+
+@app.post("/query/batch")
+async def query_batch(batch: BatchQueryIn):
+    """
+    Questions en lot (évaluations, FAQ) : un seul encode pour toutes les questions,
+    un search_batch par collection, appels LLM bornés par BATCH_LLM_CONCURRENCY.
+    Les résultats sont renvoyés dans l'ordre des questions.
+    """
+    items = batch.items
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many items (max {BATCH_MAX_ITEMS})")
+    if not items:
+        return {"results": []}
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    configured = configured_domains()
+    todo: List[int] = []
+    for idx, q in enumerate(items):
+        try:
+            _check_domain(q, configured)
+        except HTTPException as exc:
+            results[idx] = {"error": exc.detail, "status_code": exc.status_code}
+            continue
+        canned = _intent_response(q)
+        if canned is not None:
+            results[idx] = _shape_response(canned, q)
+        else:
+            todo.append(idx)
+    if not todo:
+        # Lot fait uniquement d'intents ou d'erreurs : le retriever n'est pas chargé
+        return {"results": results}
+
+    retriever = await aget_retriever()
+    available = set(getattr(retriever, "available_collections", []))
+    vectors = await retriever.aembed_many([items[i].question for i in todo])
+
+    routes: Dict[int, Dict[str, Any]] = {}
+    for idx, vector in zip(todo, vectors):
+        q = items[idx]
+        try:
+            route = await _route_query(q, retriever, available, vector)
+        except HTTPException as exc:
+            results[idx] = {"error": exc.detail, "status_code": exc.status_code}
+            continue
+        if "response" in route:
+            results[idx] = _shape_response(route["response"], q)
+        else:
+            routes[idx] = route
+
+    pending = list(routes)
+    hits = await retriever.asearch_many(
+        [items[i].question for i in pending],
+        [items[i].top_k for i in pending],
+        [routes[i]["search_domain"] for i in pending],
+        vectors=[routes[i]["search_vector"] for i in pending],
+    )
+
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer_one(idx: int, contexts: List[Dict], skipped: Dict[str, str]) -> None:
+        plan = _plan_from_hits(items[idx], routes[idx], contexts, skipped)
+        _log_gate_check(items[idx], plan)
+        gated = await _gated_response(plan, items[idx], retriever)
+        if gated is not None:
+            results[idx] = _shape_response(gated, items[idx])
+            return
+        async with semaphore:
+            results[idx] = _shape_response(await _answer_plan(plan, items[idx].temperature), items[idx])
+
+    await asyncio.gather(*(answer_one(i, ctx, sk) for i, (ctx, sk) in zip(pending, hits)))
+    return {"results": results}
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/query/stream")
+async def query_stream(q: QueryIn):
+    """
+    Même pipeline que /query, en Server-Sent Events :
+    `contexts` → `token`* → `sources` (si ajoutées) → `done`.
+    Si le LLM coupe en cours de route : `error` à la place de `done`, rien n'est mis en cache.
+    """
+    plan = await _prepare_query(q)
+
+    async def events():
+        if "response" in plan:
+            response = plan["response"]
+            yield _sse("contexts", {"contexts": _shape_response(response, q).get("contexts", [])})
+            yield _sse("token", {"text": response["answer"]})
+            yield _sse("done", {"answer": response["answer"], "cache": response.get("cache")})
+            return
+
+        head = {"contexts": _shape_response({"contexts": plan["contexts"]}, q)["contexts"]}
+        if plan["skipped"]:
+            head["skipped_collections"] = plan["skipped"]
+        yield _sse("contexts", head)
+
+        if plan["prefix"]:
+            yield _sse("token", {"text": plan["prefix"]})
+        parts: List[str] = []
+        try:
+            async for delta in astream_answer(plan["prompt"], temperature=q.temperature):
+                parts.append(delta)
+                yield _sse("token", {"text": delta})
+        except StreamInterrupted:
+            # Réponse tronquée : le client est prévenu, le cache ne la verra pas
+            error = {
+                "detail": "La génération a été interrompue. Réessaie dans un instant.",
+                "partial_answer": plan["prefix"] + "".join(parts),
+            }
+            yield _sse("error", error)
+            return
+
+        raw = "".join(parts)
+        answer = plan["prefix"] + raw
+        trailer = _sources_trailer(answer, plan["contexts_for_prompt"])
+        if trailer:
+            answer += trailer
+            yield _sse("sources", {"text": trailer})
+        done = {"answer": answer}
+        if plan["packing"]:
+            done["context_packing"] = plan["packing"]
+        _finalize_response(plan, answer, cacheable=not is_fallback_answer(raw))
+        yield _sse("done", done)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 def build_prompt(
     question: str,
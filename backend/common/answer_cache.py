@@ -0,0 +1,151 @@
+"""Full-response cache for /query with optional semantic (paraphrase) lookup."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from common.text import normalize_question
+
+# (normalized question, domain, top_k, temperature bucket)
+CacheKey = Tuple[str, str, int, int]
+
+
+class AnswerCache:
+    """LRU + TTL cache of /query responses.
+
+    Exact hits are keyed on the normalized question; when ``similarity_threshold``
+    is set, a miss falls back to a cosine lookup over the cached query vectors that
+    share the same (domain, top_k, temperature bucket).
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float = 3600.0,
+        similarity_threshold: float = 0.0,
+        temperature_step: float = 0.1,
+    ):
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.similarity_threshold = float(similarity_threshold or 0.0)
+        self.temperature_step = temperature_step if temperature_step > 0 else 0.1
+        self._entries: "OrderedDict[CacheKey, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.enabled and self.similarity_threshold > 0
+
+    def make_key(self, question: str, domain: str, top_k: int, temperature: float) -> CacheKey:
+        bucket = int(round(float(temperature) / self.temperature_step))
+        return (normalize_question(question), domain, int(top_k), bucket)
+
+    def get(self, key: CacheKey, vector: Optional[Sequence[float]] = None) -> Optional[Tuple[Dict, str]]:
+        """Return ``(response, "exact"|"semantic")`` or ``None``."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry["response"]), "exact"
+            if vector is not None and self.similarity_threshold > 0:
+                match = self._nearest(key, vector)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.semantic_hits += 1
+                    return dict(self._entries[match]["response"]), "semantic"
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        key: CacheKey,
+        response: Dict,
+        collections: Iterable[str],
+        vector: Optional[Sequence[float]] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        entry = {
+            "response": dict(response),
+            "collections": set(collections),
+            "vector": _unit(vector) if vector is not None else None,
+            "stored_at": time.monotonic(),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection: Optional[str] = None) -> int:
+        """Drop every entry (or only those built from ``collection``); returns the count."""
+        with self._lock:
+            if collection is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [k for k, e in self._entries.items() if collection in e["collections"]]
+                for k in stale:
+                    del self._entries[k]
+                removed = len(stale)
+            self.invalidations += removed
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "similarity_threshold": self.similarity_threshold,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    def _expire(self) -> None:
+        if self.ttl is None:
+            return
+        deadline = time.monotonic() - self.ttl
+        stale = [k for k, e in self._entries.items() if e["stored_at"] < deadline]
+        for k in stale:
+            del self._entries[k]
+
+    def _nearest(self, key: CacheKey, vector: Sequence[float]) -> Optional[CacheKey]:
+        _, domain, top_k, bucket = key
+        candidates: List[CacheKey] = []
+        rows = []
+        for k, entry in self._entries.items():
+            if k[1:] == (domain, top_k, bucket) and entry["vector"] is not None:
+                candidates.append(k)
+                rows.append(entry["vector"])
+        if not candidates:
+            return None
+        scores = np.stack(rows) @ _unit(vector)
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return candidates[best]
+        return None
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm else arr
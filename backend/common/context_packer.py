@@ -0,0 +1,129 @@
+"""Token-aware packing of retrieved contexts into the prompt.
+
+Chunks are cut with a 200-character overlap (``ingest/chunkers.chunk_text``), so
+neighbouring hits of the same document repeat text. ``pack_contexts``:
+
+1. drops exact duplicates (same text retrieved twice);
+2. merges chunks ``n`` and ``n + 1`` of the same ``(collection, doc_id)`` into one
+   passage, writing the shared overlap only once. Chunks whose texts do not actually
+   overlap (snippets cut independently, ``RETRIEVER_USE_SNIPPET=1``) stay separate;
+3. fills ``budget`` tokens with the passages, most relevant first (rank of the best
+   chunk of the passage); the passage that crosses the budget is trimmed at a
+   sentence or word boundary.
+
+Token counts are estimated from the character count (``chars_per_token``): the
+Mistral tokenizer is not available offline, and a stable estimate is enough to
+budget the prompt and compare before/after.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from common.text import trim_text
+
+# A shorter common prefix/suffix is treated as a coincidence, not a chunk overlap.
+MIN_OVERLAP = 20
+# Overlap written by ingest (ingest/ingest_qdrant.py -> chunkers.chunk_text, 200 characters),
+# plus some slack: longer candidates are never tried.
+MAX_OVERLAP = 200 + 50
+# Below this many tokens left, the next passage is dropped rather than trimmed.
+MIN_TRIMMED_TOKENS = 40
+
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    return math.ceil(len(text or "") / chars_per_token) if text else 0
+
+
+def overlap_length(left: str, right: str, max_overlap: Optional[int] = None) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right`` (0 if < MIN_OVERLAP)."""
+    limit = min(len(left), len(right), max_overlap or len(right))
+    for size in range(limit, MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def pack_contexts(
+    contexts: Sequence[Dict],
+    budget: int = 0,
+    chars_per_token: float = 4.0,
+) -> Tuple[List[Dict], Dict[str, int]]:
+    """Passages for the prompt and a report (tokens before/after/saved, merged, dropped).
+
+    ``contexts`` are in relevance order. A passage keeps the fields of its best chunk
+    (title, source, collection...) with the merged ``text`` and the ``chunk_ids`` it
+    covers. ``budget`` <= 0 means no token limit (merging and dedup still apply).
+    """
+    before = sum(estimate_tokens(c.get("text", ""), chars_per_token) for c in contexts)
+    passages = _merge(_dedupe(contexts))
+    merged = sum(max(0, len(p["chunk_ids"]) - 1) for p in passages)
+
+    packed: List[Dict] = []
+    used = 0
+    dropped = 0
+    for passage in passages:
+        tokens = estimate_tokens(passage["text"], chars_per_token)
+        if budget > 0 and used + tokens > budget:
+            left = budget - used
+            if left < MIN_TRIMMED_TOKENS:
+                dropped += 1
+                continue
+            passage = {**passage, "text": trim_text(passage["text"], int(left * chars_per_token))}
+            tokens = estimate_tokens(passage["text"], chars_per_token)
+        packed.append(passage)
+        used += tokens
+
+    report = {
+        "tokens_before": before,
+        "tokens_after": used,
+        "tokens_saved": max(0, before - used),
+        "merged": merged,
+        "dropped": dropped,
+    }
+    return packed, report
+
+
+def _dedupe(contexts: Sequence[Dict]) -> List[Tuple[int, Dict]]:
+    seen = set()
+    out = []
+    for rank, ctx in enumerate(contexts):
+        key = " ".join((ctx.get("text") or "").split())
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        out.append((rank, ctx))
+    return out
+
+
+def _merge(ranked: List[Tuple[int, Dict]]) -> List[Dict]:
+    """Runs of consecutive, overlapping chunks of one document become one passage, ordered by best rank."""
+    groups: Dict[Tuple, List[Tuple[int, Dict]]] = {}
+    for rank, ctx in ranked:
+        doc_id, chunk_id = ctx.get("doc_id"), ctx.get("chunk_id")
+        # Without ingest ids (older points) a chunk is its own group.
+        key = (ctx.get("collection"), doc_id) if doc_id is not None and chunk_id is not None else ("", rank)
+        groups.setdefault(key, []).append((rank, ctx))
+
+    passages: List[Tuple[int, Dict]] = []
+    for members in groups.values():
+        members.sort(key=lambda item: item[1].get("chunk_id", 0))
+        run: List[Tuple[int, Dict, int]] = []
+        for rank, ctx in members:
+            size = 0
+            if run and ctx.get("chunk_id") == run[-1][1].get("chunk_id") + 1:
+                # The merged text ends with the previous chunk: only that pair needs checking.
+                size = overlap_length(run[-1][1].get("text", ""), ctx.get("text", ""), MAX_OVERLAP)
+            if run and not size:
+                passages.append(_passage(run))
+                run = []
+            run.append((rank, ctx, size))
+        passages.append(_passage(run))
+    passages.sort(key=lambda item: item[0])
+    return [passage for _, passage in passages]
+
+
+def _passage(run: List[Tuple[int, Dict, int]]) -> Tuple[int, Dict]:
+    """One passage from chunks that each overlap the previous one by ``size`` characters."""
+    best_rank, best, _ = min(run, key=lambda item: item[0])
+    text = run[0][1].get("text", "") + "".join(ctx.get("text", "")[size:] for _, ctx, size in run[1:])
+    chunk_ids = [ctx["chunk_id"] for _, ctx, _ in run if ctx.get("chunk_id") is not None]
+    return best_rank, {**best, "text": text, "chunk_ids": chunk_ids}
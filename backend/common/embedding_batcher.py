@@ -0,0 +1,121 @@
+"""Async micro-batcher: coalesces concurrent query encodes into one model call.
+
+Requests arriving within ``max_wait_ms`` of the first pending one (or until
+``max_batch`` are pending) are encoded together on the given executor, and each
+caller gets back its own row. Identical texts in a batch are encoded once.
+
+At most ``max_concurrency`` batches run at a time (one per encode thread): while
+they are busy, new requests keep accumulating, so batches grow with the load.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray],
+        executor: Optional[Executor] = None,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+        max_concurrency: int = 1,
+    ):
+        self._encode = encode
+        self._executor = executor
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.encoded = 0
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.histogram: Dict[str, int] = {}
+
+    async def encode(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # New event loop (e.g. app restart in the same process): drop the old state.
+            self._loop, self._pending, self._timer, self.in_flight = loop, [], None, 0
+        future = loop.create_future()
+        self._pending.append((text, future))
+        depth = len(self._pending)
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        if depth >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Callers that gave up (cancelled/timed out) are not worth encoding.
+        self._pending = [item for item in self._pending if not item[1].done()]
+        while self._pending and self.in_flight < self.max_concurrency:
+            batch, self._pending = self._pending[: self.max_batch], self._pending[self.max_batch:]
+            self.in_flight += 1
+            self._loop.create_task(self._run(batch))
+
+    async def _run(self, batch: Sequence[Tuple[str, asyncio.Future]]) -> None:
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self._record(len(batch), len(texts))
+        try:
+            encoded = await self._loop.run_in_executor(self._executor, self._encode, texts)
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self.in_flight -= 1
+            # Requests queued while every worker was busy go out now, as one batch.
+            if self._pending:
+                self._flush()
+        rows = {text: row for text, row in zip(texts, np.asarray(encoded))}
+        for text, future in batch:
+            if not future.done():
+                future.set_result(rows[text])
+
+    def _record(self, size: int, unique: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.requests += size
+            self.encoded += unique
+            bucket = _bucket(size)
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "queue_depth": len(self._pending),
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self.in_flight,
+                "batches": self.batches,
+                "requests": self.requests,
+                "encoded": self.encoded,
+                "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.histogram.items(), key=lambda kv: _bucket_start(kv[0]))),
+            }
+
+
+def _bucket(size: int) -> str:
+    """Power-of-two buckets: "1", "2-3", "4-7", "8-15", ..."""
+    low = 1 << (size.bit_length() - 1)
+    return "1" if low == 1 else f"{low}-{2 * low - 1}"
+
+
+def _bucket_start(bucket: str) -> int:
+    return int(bucket.split("-")[0])
@@ -0,0 +1,122 @@
+"""Persistent, content-addressed embedding cache shared by ingestion and re-indexing jobs.
+
+Layout of ``<root>/<model slug>/``:
+
+- ``vectors.f32``: append-only float32 matrix (``dim`` columns), read through ``np.memmap``;
+- ``keys.txt``: one text hash per line, line ``i`` being row ``i`` of the matrix.
+
+Both files are only ever appended to, so an interrupted run at worst leaves a
+trailing partial row, which is ignored on the next load.
+"""
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+def _slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name).strip("_") or "model"
+
+
+class EmbeddingStore:
+    def __init__(self, root, model_name: str, dim: int = 384):
+        self.model_name = model_name
+        self.dim = int(dim)
+        self.path = Path(root) / _slug(model_name)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.path / "vectors.f32"
+        self._keys_path = self.path / "keys.txt"
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _load(self) -> None:
+        row_bytes = self.dim * 4
+        rows = self._vectors_path.stat().st_size // row_bytes if self._vectors_path.exists() else 0
+        keys: List[str] = []
+        if self._keys_path.exists():
+            keys = self._keys_path.read_text(encoding="ascii").split()
+        count = min(rows, len(keys))
+        # Repair an interrupted append: keep only rows present in both files.
+        if rows != count and self._vectors_path.exists():
+            with open(self._vectors_path, "r+b") as fh:
+                fh.truncate(count * row_bytes)
+        if len(keys) != count:
+            self._keys_path.write_text("".join(f"{k}\n" for k in keys[:count]), encoding="ascii")
+        self._index = {key: row for row, key in enumerate(keys[:count])}
+        self._remap()
+
+    def _remap(self) -> None:
+        if self._index:
+            self._matrix = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(len(self._index), self.dim)
+            )
+        else:
+            self._matrix = None
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self._index.get(key)
+        if row is None or self._matrix is None:
+            return None
+        return np.array(self._matrix[row])
+
+    def put_many(self, keys: Sequence[str], vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            fresh = [(k, v) for k, v in zip(keys, vectors) if k not in self._index]
+            if not fresh:
+                return
+            seen = set()
+            unique = []
+            for key, vec in fresh:
+                if key not in seen:
+                    seen.add(key)
+                    unique.append((key, vec))
+            with open(self._vectors_path, "ab") as fh:
+                fh.write(np.stack([v for _, v in unique]).astype(np.float32).tobytes())
+                fh.flush()
+                os.fsync(fh.fileno())
+            with open(self._keys_path, "a", encoding="ascii") as fh:
+                fh.write("".join(f"{k}\n" for k, _ in unique))
+            start = len(self._index)
+            for offset, (key, _) in enumerate(unique):
+                self._index[key] = start + offset
+            self._remap()
+
+    def encode(self, texts: Sequence[str], model, keys: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Embeddings for ``texts``; only texts never seen for this model go through ``model.encode``."""
+        keys = list(keys) if keys is not None else [text_hash(t) for t in texts]
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        missing: List[int] = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                row = self._index.get(key)
+                if row is None:
+                    missing.append(i)
+                else:
+                    out[i] = self._matrix[row]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            encoded = np.asarray(model.encode([texts[i] for i in missing]), dtype=np.float32)
+            encoded = encoded.reshape(len(missing), self.dim)
+            out[missing] = encoded
+            self.put_many([keys[i] for i in missing], encoded)
+        return out
+
+    def stats(self) -> Dict:
+        return {"size": len(self._index), "hits": self.hits, "misses": self.misses, "path": str(self.path)}
@@ -0,0 +1,135 @@
+"""Pluggable sentence-embedding backends shared by the retriever and the ingester.
+
+Every backend exposes ``encode(texts)`` with the SentenceTransformer contract
+(a ``str`` gives a 1-D array, a list gives a 2-D array) and returns
+L2-normalised all-MiniLM-L6-v2 vectors, so backends can be swapped without
+re-indexing what is already stored in Qdrant:
+
+- ``torch``: sentence-transformers on PyTorch, the reference implementation;
+- ``onnx``: ONNX Runtime on the int8-quantized export written by
+  ``python -m retrievers.export_model --onnx``. It only imports ``onnxruntime``,
+  ``tokenizers`` and numpy, never torch.
+"""
+import json
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+EMB_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMB_DIM = 384
+# "torch" (default) or "onnx".
+EMBEDDING_BACKEND = (os.getenv("EMBEDDING_BACKEND") or "torch").strip().lower()
+# Optional directory of a pre-saved copy of EMB_NAME (see retrievers/export_model.py):
+# loads from local disk, without any Hugging Face Hub resolution at cold start.
+EMB_MODEL_PATH = (os.getenv("EMB_MODEL_PATH") or "").strip()
+# Directory of the ONNX export used by the "onnx" backend.
+EMB_ONNX_PATH = (os.getenv("EMB_ONNX_PATH") or "").strip() or str(
+    Path(__file__).resolve().parent.parent / "data" / "models" / "all-MiniLM-L6-v2-onnx"
+)
+# ONNX Runtime intra-op threads (0 lets ONNX Runtime decide).
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+ONNX_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "embedding_config.json"
+# all-MiniLM-L6-v2 truncates inputs to 256 word pieces.
+MAX_SEQ_LENGTH = 256
+
+Texts = Union[str, Sequence[str]]
+
+
+class SentenceTransformerEmbedder:
+    """Reference backend: sentence-transformers on PyTorch CPU."""
+
+    backend = "torch"
+
+    def __init__(self, path: Optional[str] = None):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = EMB_NAME
+        self.model = SentenceTransformer(path or EMB_MODEL_PATH or EMB_NAME, device="cpu")
+
+    def encode(self, texts: Texts, batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+
+
+class OnnxEmbedder:
+    """MiniLM transformer run by ONNX Runtime, with mean pooling and normalisation in numpy."""
+
+    backend = "onnx"
+
+    def __init__(self, path: Optional[str] = None, threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = Path(path or EMB_ONNX_PATH)
+        config = _onnx_config(path)
+        model_file = config.get("model_file", ONNX_MODEL_FILE)
+        self.name = _onnx_name(config)
+        self.dim = int(config.get("dim", EMB_DIM))
+
+        self.tokenizer = Tokenizer.from_file(str(path / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=int(config.get("max_seq_length", MAX_SEQ_LENGTH)))
+        pad_token = config.get("pad_token", "[PAD]")
+        pad_id = self.tokenizer.token_to_id(pad_token)
+        self.tokenizer.enable_padding(pad_id=pad_id if pad_id is not None else 0, pad_token=pad_token)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = ONNX_THREADS if threads is None else threads
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            str(path / model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: Texts, batch_size: int = 32) -> np.ndarray:
+        single = isinstance(texts, str)
+        batch: List[str] = [texts] if single else list(texts)
+        out = np.empty((len(batch), self.dim), dtype=np.float32)
+        for start in range(0, len(batch), batch_size):
+            out[start:start + batch_size] = self._encode_batch(batch[start:start + batch_size])
+        return out[0] if single else out
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, feeds)[0]
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.where(norms == 0, 1, norms)
+
+
+def embedder_name(backend: Optional[str] = None) -> str:
+    """Identifier of the vectors a backend produces, without loading it (cache/manifest key)."""
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    return _onnx_name(_onnx_config(Path(EMB_ONNX_PATH))) if backend == "onnx" else EMB_NAME
+
+
+def load_embedder(backend: Optional[str] = None, path: Optional[str] = None):
+    """Instantiate the configured backend (``EMBEDDING_BACKEND`` unless overridden)."""
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend == "onnx":
+        return OnnxEmbedder(path)
+    if backend == "torch":
+        return SentenceTransformerEmbedder(path)
+    raise ValueError(f"Unknown embedding backend: {backend!r} (expected 'torch' or 'onnx')")
+
+
+def _onnx_config(path: Path) -> dict:
+    try:
+        return json.loads((path / CONFIG_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _onnx_name(config: dict) -> str:
+    return f"{config.get('model', EMB_NAME)}@onnx-{config.get('weights', 'int8')}"
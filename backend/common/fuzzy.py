@@ -0,0 +1,158 @@
+"""Indexed replacement for ``difflib.get_close_matches(word, vocab, n=1, cutoff)`` verdicts.
+
+``has_close_match`` returns exactly what ``bool(get_close_matches(...))`` would:
+a candidate matches when ``SequenceMatcher.ratio() >= cutoff``. Candidates are
+pruned with two upper bounds of that ratio before the (slow) matcher runs:
+
+- length: ``ratio <= 2 * min(la, lb) / (la + lb)``, so only a few length buckets
+  of the vocabulary are ever looked at;
+- character multiset: ``ratio <= 2 * |chars(a) & chars(b)| / (la + lb)``
+  (difflib's ``quick_ratio``), evaluated for the whole vocabulary at once on a
+  numpy matrix of per-token character counts.
+
+The per-text token data (set, counts, lengths) is memoised: the same chunks come
+back for many questions, so a request mostly concatenates cached arrays.
+
+Micro-benchmark against difflib on the bundled corpus (from backend/)::
+
+    python -m common.fuzzy --corpus data/raw
+"""
+import math
+import string
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Sequence, Tuple
+
+import numpy as np
+
+from common.text import tokenize
+
+# tokenize() only yields [a-z0-9]; anything else shares a last "other" column,
+# which can only over-estimate the common characters (the bound stays safe).
+_ALPHABET = {ch: i for i, ch in enumerate(string.ascii_lowercase + string.digits)}
+_COLUMNS = len(_ALPHABET) + 1
+
+
+def _char_vector(token: str) -> np.ndarray:
+    vector = np.zeros(_COLUMNS, dtype=np.int16)
+    for ch in token:
+        vector[_ALPHABET.get(ch, _COLUMNS - 1)] += 1
+    return vector
+
+
+@lru_cache(maxsize=4096)
+def _token_data(tokens: FrozenSet[str]) -> Tuple[Tuple[str, ...], np.ndarray, np.ndarray]:
+    ordered = tuple(sorted(tokens))
+    counts = np.zeros((len(ordered), _COLUMNS), dtype=np.int16)
+    for row, token in enumerate(ordered):
+        counts[row] = _char_vector(token)
+    lengths = np.fromiter((len(t) for t in ordered), dtype=np.int32, count=len(ordered))
+    return ordered, counts, lengths
+
+
+@lru_cache(maxsize=4096)
+def text_tokens(text: str) -> FrozenSet[str]:
+    """Token set of a context text (memoised: the same chunks come back for many questions)."""
+    return frozenset(tokenize(text))
+
+
+@lru_cache(maxsize=65536)
+def _ratio(word: str, candidate: str) -> float:
+    # Same orientation as get_close_matches: seq1 = candidate, seq2 = word.
+    return SequenceMatcher(None, candidate, word).ratio()
+
+
+class FuzzyIndex:
+    """Character-count matrix over a vocabulary, built from cached per-text blocks."""
+
+    def __init__(self, token_sets: Sequence[FrozenSet[str]]):
+        blocks = [_token_data(frozenset(tokens)) for tokens in token_sets if tokens]
+        self.tokens = frozenset().union(*token_sets) if token_sets else frozenset()
+        # Tokens shared by several texts appear more than once: harmless for a yes/no match.
+        self._words = [w for block in blocks for w in block[0]]
+        self._counts = np.concatenate([b[1] for b in blocks]) if blocks else np.zeros((0, _COLUMNS), np.int16)
+        self._lengths = np.concatenate([b[2] for b in blocks]) if blocks else np.zeros(0, np.int32)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "FuzzyIndex":
+        return cls([text_tokens(text) for text in texts if text])
+
+    def __contains__(self, token: str) -> bool:
+        return token in self.tokens
+
+    def has_close_match(self, word: str, cutoff: float = 0.6) -> bool:
+        """``bool(difflib.get_close_matches(word, vocabulary, n=1, cutoff=cutoff))``."""
+        if not self._words:
+            return False
+        lw = len(word)
+        # 2*min(la, lw)/(la + lw) >= cutoff  <=>  la in [lw*c/(2-c), lw*(2-c)/c]
+        low = math.ceil(lw * cutoff / (2 - cutoff) - 1e-9)
+        high = math.floor(lw * (2 - cutoff) / cutoff + 1e-9) if cutoff > 0 else int(self._lengths.max())
+        rows = np.flatnonzero((self._lengths >= low) & (self._lengths <= high))
+        if not len(rows):
+            return False
+        common = np.minimum(self._counts[rows], _char_vector(word)).sum(axis=1)
+        bound = 2.0 * common / (self._lengths[rows] + lw)
+        keep = bound >= cutoff - 1e-9
+        # Most promising candidates first: a hit usually comes from the first one.
+        for i in rows[keep][np.argsort(-bound[keep], kind="stable")]:
+            if _ratio(word, self._words[i]) >= cutoff:
+                return True
+        return False
+
+
+def _benchmark(corpus: str, cutoff: float, rounds: int) -> None:
+    import random
+    import time
+    from difflib import get_close_matches
+    from pathlib import Path
+
+    texts = [p.read_text(encoding="utf-8", errors="ignore") for p in Path(corpus).rglob("*.txt")]
+    chunks = [t[i:i + 1200] for t in texts for i in range(0, len(t), 1000)]
+    rng = random.Random(0)
+    vocab_all = sorted({tok for c in chunks[:400] for tok in tokenize(c)})
+    cases = []
+    for _ in range(rounds):
+        contexts = rng.sample(chunks, min(4, len(chunks)))
+        words = rng.sample(vocab_all, 6)
+        # Typos: one letter dropped or replaced.
+        typos = [w[:i] + w[i + 1:] if i % 2 else w[:i] + "x" + w[i + 1:] for w in words for i in [len(w) // 2]]
+        cases.append((contexts, words[:3] + typos + ["irrigation", "tracteur", "kiwi"]))
+
+    def reference(contexts, words):
+        vocab = set()
+        for c in contexts:
+            vocab.update(tokenize(c))
+        vocab = list(vocab)
+        return [bool(get_close_matches(w, vocab, n=1, cutoff=cutoff)) for w in words]
+
+    def indexed(contexts, words):
+        index = FuzzyIndex.from_texts(contexts)
+        return [w in index or index.has_close_match(w, cutoff) for w in words]
+
+    t0 = time.perf_counter()
+    expected = [reference(c, w) for c, w in cases]
+    t1 = time.perf_counter()
+    got = [indexed(c, w) for c, w in cases]
+    t2 = time.perf_counter()
+    got_warm = [indexed(c, w) for c, w in cases]
+    t3 = time.perf_counter()
+    same = expected == got == got_warm
+    n = len(cases)
+    print(f"{n} requêtes, cutoff={cutoff}, verdicts identiques: {same}")
+    print(f"difflib        : {1000 * (t1 - t0) / n:.3f} ms/requête")
+    print(f"index (froid)  : {1000 * (t2 - t1) / n:.3f} ms/requête")
+    print(f"index (chaud)  : {1000 * (t3 - t2) / n:.3f} ms/requête")
+    if not same:
+        raise SystemExit("Verdicts différents de difflib")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Micro-benchmark FuzzyIndex vs difflib")
+    ap.add_argument("--corpus", default="data/raw")
+    ap.add_argument("--cutoff", type=float, default=0.82)
+    ap.add_argument("--rounds", type=int, default=300)
+    args = ap.parse_args()
+    _benchmark(args.corpus, args.cutoff, args.rounds)
@@ -0,0 +1,40 @@
+"""Text normalisation helpers shared by the API, the retriever and the ingestion scripts."""
+import re
+from typing import List
+from unicodedata import normalize
+
+WORD_RE = re.compile(r"[a-z0-9]{3,}")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_text(value: str) -> str:
+    """Return a lowercase ASCII-only version of the input."""
+    normalized = normalize("NFKD", (value or ""))
+    return normalized.encode("ascii", "ignore").decode("ascii").lower()
+
+
+def tokenize(value: str) -> List[str]:
+    """Tokenize text for simple keyword coverage checks."""
+    return WORD_RE.findall(normalize_text(value))
+
+
+def normalize_question(value: str) -> str:
+    """Cache key for a question: normalized text, collapsed spaces, no trailing punctuation."""
+    text = _SPACES_RE.sub(" ", normalize_text(value)).strip()
+    return text.rstrip("!?.;: ").strip()
+
+
+_SENTENCE_END_RE = re.compile(r"[.!?;](?=\s)")
+
+
+def trim_text(value: str, max_chars: int) -> str:
+    """Collapse whitespace and cut to ``max_chars``, at a sentence end if one is close, else a word."""
+    text = _SPACES_RE.sub(" ", value or "").strip()
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    cut = text[: max_chars - 1]
+    ends = [m.end() for m in _SENTENCE_END_RE.finditer(cut + " ")]
+    if ends and ends[-1] >= 0.6 * max_chars:
+        return cut[: ends[-1]].strip()
+    word_cut = cut.rsplit(" ", 1)[0] if " " in cut else cut
+    return word_cut.rstrip(" ,;:") + "…"
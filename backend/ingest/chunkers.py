@@ -2,6 +2,8 @@ from pathlib import Path
 import re
 from typing import Iterable, Iterator, Dict
 
+from common.text import trim_text
+
 
 def _read_txt(path: Path) -> str:
     return path.read_text(encoding="utf-8", errors="ignore")
@@ -85,10 +87,15 @@ def build_chunks(
     chunk_size: int = 1200,
     overlap: int = 200,
     domain: str = "unknown",
+    snippet_chars: int = 0,
 ) -> Iterator[Dict[str, str]]:
+    """
+    Découpe les documents en chunks prêts pour Qdrant. Avec ``snippet_chars`` > 0,
+    chaque chunk porte aussi un extrait ``snippet`` déjà tronqué pour le prompt.
+    """
     for doc in docs:
         for idx, part in enumerate(chunk_text(doc["text"], chunk_size, overlap)):
-            yield {
+            chunk = {
                 "doc_id": doc["source"],
                 "chunk_id": idx,
                 "domain": domain,
@@ -97,3 +104,6 @@ def build_chunks(
                 "lang": "fr",
                 "text": part,
             }
+            if snippet_chars > 0:
+                chunk["snippet"] = trim_text(part, snippet_chars)
+            yield chunk
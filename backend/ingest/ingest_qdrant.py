@@ -1,10 +1,23 @@
 import argparse
+import logging
 import os
+import sys
+from pathlib import Path
 
+import requests
 from qdrant_client import QdrantClient
 
+# Lancé en script (python ingest/ingest_qdrant.py) : rend backend/ importable (common/...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
 from chunkers import load_docs_from_folder, build_chunks
-from ingest_qdrant_core import ingest_documents  # voir bloc suivant
+from ingest_qdrant_core import (  # voir bloc suivant
+    default_manifest_path,
+    export_centroids,
+    export_local_index,
+    ingest_documents,
+    open_embedding_store,
+)
 
 try:  # load .env for local runs
     from dotenv import load_dotenv
@@ -35,6 +48,25 @@ def _get_qdrant_env(collection: str):
     return url, key
 
 
+def _invalidate_api_cache(api_url: str, collection: str) -> None:
+    """Purge les réponses en cache de l'API construites sur cette collection."""
+    headers = {}
+    token = (os.getenv("ADMIN_TOKEN") or "").strip()
+    if token:
+        headers["X-Admin-Token"] = token
+    try:
+        response = requests.post(
+            f"{api_url.rstrip('/')}/cache/invalidate",
+            params={"collection": collection},
+            headers=headers,
+            timeout=10,
+        )
+        response.raise_for_status()
+        print(f"Cache API invalidé: {response.json().get('invalidated', 0)} réponses")
+    except requests.RequestException as exc:
+        print(f"Invalidation du cache API impossible ({exc})")
+
+
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--folder", required=True, help="Chemin des documents (raw)")
@@ -48,7 +80,71 @@ if __name__ == "__main__":
         required=True,
         help="Nom logique du domaine (sols|marche|cultures|eau|meca)",
     )
+    ap.add_argument("--batch-size", type=int, default=64, help="Taille des lots d'encodage")
+    ap.add_argument("--upsert-workers", type=int, default=2, help="Threads d'upsert en parallèle")
+    ap.add_argument(
+        "--manifest",
+        default=None,
+        help="Manifeste local des chunks ingérés (défaut: data/manifests/<collection>.json)",
+    )
+    ap.add_argument(
+        "--no-manifest",
+        action="store_true",
+        help="Ré-encode tout le dossier (les IDs restent déterministes, sans doublons)",
+    )
+    ap.add_argument(
+        "--keep-missing",
+        action="store_true",
+        help="Ne supprime pas les points des documents absents du dossier",
+    )
+    ap.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Recrée la collection (purge les doublons des anciennes ingestions à UUID aléatoires)",
+    )
+    ap.add_argument(
+        "--embedding-cache",
+        default=None,
+        help="Dossier du cache d'embeddings sur disque (défaut: data/embeddings)",
+    )
+    ap.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="Encode tous les chunks sans passer par le cache disque",
+    )
+    ap.add_argument(
+        "--snippet-chars",
+        type=int,
+        default=0,
+        help=(
+            "Stocke aussi un extrait 'snippet' de N caractères, prêt pour le prompt (RETRIEVER_USE_SNIPPET). "
+            "Sur une collection existante, combiner avec --no-manifest : les IDs de points ne changent pas"
+        ),
+    )
+    ap.add_argument(
+        "--embedding-backend",
+        choices=["torch", "onnx"],
+        default=None,
+        help="Backend d'encodage (défaut: EMBEDDING_BACKEND, sinon torch)",
+    )
+    ap.add_argument(
+        "--no-local-index",
+        action="store_true",
+        help="N'exporte pas l'instantané local (data/index/<collection>) utilisé par LOCAL_INDEX_MODE",
+    )
+    ap.add_argument(
+        "--prototypes",
+        type=int,
+        default=4,
+        help="Prototypes par collection pour le routeur de domaines (data/centroids/<collection>.json, 0 = aucun)",
+    )
+    ap.add_argument(
+        "--api-url",
+        default=os.getenv("FARMLINK_API_URL", ""),
+        help="URL de l'API FarmLink dont il faut invalider le cache de réponses",
+    )
     args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
     url, key = _get_qdrant_env(args.collection)
     if not url or not key:
@@ -58,7 +154,33 @@ if __name__ == "__main__":
 
     client = QdrantClient(url=url, api_key=key)
 
-    docs = load_docs_from_folder(args.folder, domain=args.domain)
-    chunks = build_chunks(docs, chunk_size=1200, overlap=200, domain=args.domain)
-    inserted = ingest_documents(client, args.collection, chunks, domain=args.domain)
+    docs = load_docs_from_folder(args.folder)
+    chunks = build_chunks(
+        docs, chunk_size=1200, overlap=200, domain=args.domain, snippet_chars=args.snippet_chars
+    )
+    inserted = ingest_documents(
+        client,
+        args.collection,
+        chunks,
+        domain=args.domain,
+        batch_size=args.batch_size,
+        upsert_workers=args.upsert_workers,
+        manifest_path=None if args.no_manifest else (args.manifest or default_manifest_path(args.collection)),
+        prune_missing=not args.keep_missing,
+        rebuild=args.rebuild,
+        embedding_store=(
+            None
+            if args.no_embedding_cache
+            else open_embedding_store(args.embedding_cache, args.embedding_backend)
+        ),
+        embedding_backend=args.embedding_backend,
+    )
     print(f"Ingestion OK: {inserted} chunks -> {args.collection}")
+    if not args.no_local_index:
+        export_local_index(client, args.collection)
+    if args.prototypes > 0:
+        export_centroids(
+            client, args.collection, prototypes=args.prototypes, embedding_backend=args.embedding_backend
+        )
+    if args.api_url:
+        _invalidate_api_cache(args.api_url, args.collection)
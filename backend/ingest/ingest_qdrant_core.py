@@ -1,26 +1,105 @@
 from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import queue
+import shutil
+import threading
 import uuid
-from typing import Iterable, Dict
+from typing import Iterable, Iterator, Dict, List, Optional, Set
 
+import numpy as np
 from qdrant_client.http import models as qm
 
-EMB_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+from common.embedding_store import EmbeddingStore
+from common.embeddings import EMB_NAME, embedder_name, load_embedder
+from common.text import tokenize
+from retrievers.bm25_index import BM25Index
+from retrievers.domain_router import compute_prototypes, save_centroids
+from retrievers.local_index import POINTS_FILE, VECTORS_FILE
 
+# Espace de noms des IDs de points : uuid5(doc_id:chunk_id:hash du texte).
+POINT_NAMESPACE = uuid.UUID("6f1c2b8e-5d0a-4e55-9a57-3f2f6c1b7a10")
+MANIFEST_DIR = Path(__file__).resolve().parent.parent / "data" / "manifests"
+EMBEDDING_CACHE_DIR = Path(__file__).resolve().parent.parent / "data" / "embeddings"
+LOCAL_INDEX_DIR = Path(__file__).resolve().parent.parent / "data" / "index"
+CENTROIDS_DIR = Path(__file__).resolve().parent.parent / "data" / "centroids"
 
-def _embedder():
-    from sentence_transformers import SentenceTransformer
+_DONE = object()
 
-    return SentenceTransformer(EMB_NAME)
+logger = logging.getLogger(__name__)
 
 
-def ensure_collection(client, collection: str, dim: int = 384):
+class _LazyModel:
+    """Charge le modèle au premier encode : inutile si tout est déjà dans le cache disque."""
+
+    def __init__(self, backend: Optional[str] = None):
+        self.backend = backend
+        self.name = embedder_name(backend)
+        self._model = None
+        self._lock = threading.Lock()
+
+    def encode(self, texts):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = load_embedder(self.backend)
+        return self._model.encode(texts)
+
+
+def open_embedding_store(root=None, backend: Optional[str] = None) -> EmbeddingStore:
+    # Un cache par backend : les vecteurs int8 (onnx) et torch sont proches mais pas identiques.
+    return EmbeddingStore(root or EMBEDDING_CACHE_DIR, embedder_name(backend))
+
+
+def ensure_collection(client, collection: str, dim: int = 384, recreate: bool = False) -> bool:
+    """Crée la collection si besoin ; renvoie True si elle est (re)créée vide."""
+    if not recreate:
+        try:
+            client.get_collection(collection)
+            return False
+        except Exception:
+            pass
+    client.recreate_collection(
+        collection_name=collection,
+        vectors_config=qm.VectorParams(size=dim, distance=qm.Distance.COSINE),
+    )
+    return True
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+def point_id(chunk: Dict) -> str:
+    """ID déterministe : ré-ingérer le même chunk écrase le point au lieu de le dupliquer."""
+    digest = chunk.get("chunk_hash") or chunk_hash(chunk.get("text", ""))
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{chunk.get('doc_id')}:{chunk.get('chunk_id')}:{digest}"))
+
+
+def default_manifest_path(collection: str) -> Path:
+    return MANIFEST_DIR / f"{collection}.json"
+
+
+def load_manifest(path) -> Dict:
     try:
-        client.get_collection(collection)
-    except Exception:
-        client.recreate_collection(
-            collection_name=collection,
-            vectors_config=qm.VectorParams(size=dim, distance=qm.Distance.COSINE),
-        )
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return {"documents": {}}
+    data.setdefault("documents", {})
+    return data
+
+
+def save_manifest(path, manifest: Dict) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
 
 
 def ingest_documents(
@@ -29,36 +108,292 @@ def ingest_documents(
     docs: Iterable[Dict[str, str]],
     domain: str,
     batch_size: int = 64,
+    upsert_workers: int = 2,
+    queue_size: int = 4,
+    model=None,
+    manifest_path=None,
+    prune_missing: bool = True,
+    rebuild: bool = False,
+    embedding_store: Optional[EmbeddingStore] = None,
+    embedding_backend: Optional[str] = None,
 ) -> int:
-    model = _embedder()
-    ensure_collection(client, collection)
+    """
+    Pipeline en 3 étages qui se chevauchent :
+    lecture/chunking (thread appelant) → encodage (1 thread) → upserts (``upsert_workers`` threads).
+
+    Les files entre étages sont bornées (``queue_size`` lots) pour limiter la mémoire.
+    Les upserts partent en ``wait=False`` ; une barrière finale ``wait=True`` garantit
+    que tout est appliqué avant le retour.
+
+    Avec ``manifest_path``, l'ingestion est incrémentale : seuls les chunks nouveaux ou
+    modifiés sont encodés/upsertés, les chunks disparus sont supprimés de Qdrant
+    (y compris ceux des documents absents si ``prune_missing``). Renvoie le nombre
+    de chunks upsertés.
+
+    ``embedding_store`` (voir common/embedding_store.py) évite de ré-encoder un texte
+    déjà vu avec ce modèle, même pour une autre collection ou un autre cluster.
+
+    ``embedding_backend`` ("torch" ou "onnx", défaut EMBEDDING_BACKEND) choisit le
+    backend d'encodage (voir common/embeddings.py) quand ``model`` n'est pas fourni.
+    """
+    model = model or _LazyModel(embedding_backend)
+    model_name = getattr(model, "name", EMB_NAME)
+    created = ensure_collection(client, collection, recreate=rebuild)
     now = datetime.utcnow().isoformat()
-    batch = []
-    total = 0
 
+    manifest = load_manifest(manifest_path) if manifest_path and not created else {"documents": {}}
+    previous: Dict[str, List[str]] = {
+        doc_id: list(entry.get("points", [])) for doc_id, entry in manifest["documents"].items()
+    }
+    known: Set[str] = {pid for ids in previous.values() for pid in ids}
+    if previous and manifest.get("model") != model_name:
+        # Autre modèle ou backend : les verdicts « inchangé » ne valent plus, tout est ré-encodé
+        # (mêmes IDs, les vecteurs sont écrasés) ; les anciens IDs servent encore à purger.
+        logger.warning(
+            "%s: manifeste construit avec %s, modèle courant %s : tous les chunks sont ré-encodés",
+            collection,
+            manifest.get("model"),
+            model_name,
+        )
+        known = set()
+    current: Dict[str, List[str]] = {}
+    docs = _only_new_chunks(docs, known, current)
+
+    encode_q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    upsert_q: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    errors: List[BaseException] = []
+    stop = threading.Event()
+    state = {"total": 0, "last_points": None}
+    state_lock = threading.Lock()
+    workers = max(1, upsert_workers)
+
+    # En cas d'erreur, chaque étage continue de vider sa file (sans travailler)
+    # jusqu'au marqueur de fin, pour qu'aucun producteur ne reste bloqué.
+    def encoder():
+        try:
+            while True:
+                batch = encode_q.get()
+                if batch is _DONE:
+                    break
+                if stop.is_set():
+                    continue
+                try:
+                    points = _build_points(batch, model, now, domain, embedding_store)
+                except BaseException as exc:  # propagé au thread appelant
+                    errors.append(exc)
+                    stop.set()
+                    continue
+                _put(upsert_q, points, stop)
+        finally:
+            for _ in range(workers):
+                upsert_q.put(_DONE)
+
+    def upserter():
+        while True:
+            points = upsert_q.get()
+            if points is _DONE:
+                break
+            if stop.is_set():
+                continue
+            try:
+                client.upsert(collection_name=collection, points=points, wait=False)
+            except BaseException as exc:
+                errors.append(exc)
+                stop.set()
+                continue
+            with state_lock:
+                state["total"] += len(points)
+                state["last_points"] = points
+
+    threads = [threading.Thread(target=encoder, name="ingest-encode", daemon=True)]
+    threads += [
+        threading.Thread(target=upserter, name=f"ingest-upsert-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for t in threads:
+        t.start()
+
+    try:
+        batch = []
+        for doc in docs:
+            if stop.is_set():
+                break
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                _put(encode_q, batch, stop)
+                batch = []
+        if batch and not stop.is_set():
+            _put(encode_q, batch, stop)
+    except BaseException as exc:
+        errors.append(exc)
+        stop.set()
+    finally:
+        encode_q.put(_DONE)
+        for t in threads:
+            t.join()
+
+    if errors:
+        raise errors[0]
+
+    _barrier(client, collection, state["last_points"])
+
+    stale: List[str] = []
+    for doc_id, ids in previous.items():
+        if doc_id in current:
+            keep = set(current[doc_id])
+            stale.extend(pid for pid in ids if pid not in keep)
+        elif prune_missing:
+            stale.extend(ids)
+        else:
+            current[doc_id] = ids
+    if stale:
+        client.delete(
+            collection_name=collection,
+            points_selector=qm.PointIdsList(points=stale),
+            wait=True,
+        )
+
+    logger.info(
+        "%s: %d chunks upsertés, %d inchangés, %d supprimés",
+        collection,
+        state["total"],
+        sum(len(ids) for ids in current.values()) - state["total"],
+        len(stale),
+    )
+    if embedding_store is not None:
+        logger.info("cache d'embeddings: %(hits)d réutilisés, %(misses)d encodés", embedding_store.stats())
+    if manifest_path:
+        save_manifest(
+            manifest_path,
+            {
+                "collection": collection,
+                "model": model_name,
+                "updated_at": now,
+                "documents": {doc_id: {"points": ids} for doc_id, ids in sorted(current.items())},
+            },
+        )
+    return state["total"]
+
+
+def export_local_index(client, collection: str, root=None, page_size: int = 256) -> int:
+    """
+    Exporte la collection (vecteurs normalisés + payloads + index BM25) pour l'index
+    local du retriever (voir retrievers/local_index.py et retrievers/bm25_index.py).
+    Remplace atomiquement l'export précédent.
+    """
+    root = Path(root or LOCAL_INDEX_DIR)
+    points, rows = [], []
+    for point in _scroll(client, collection, page_size, with_payload=True):
+        points.append({"id": str(point.id), "payload": point.payload or {}})
+        rows.append(point.vector)
+
+    vectors = np.asarray(rows, dtype=np.float32).reshape(len(rows), -1)
+    if len(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+    target = root / collection
+    tmp = root / f".{collection}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / VECTORS_FILE, vectors)
+    with open(tmp / POINTS_FILE, "w", encoding="utf-8") as fh:
+        json.dump(points, fh, ensure_ascii=False)
+    BM25Index.build(
+        [tokenize(f"{p['payload'].get('title', '')} {p['payload'].get('text', '')}") for p in points]
+    ).save(tmp)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    logger.info("%s: index local exporté (%d points) -> %s", collection, len(points), target)
+    return len(points)
+
+
+def export_centroids(
+    client,
+    collection: str,
+    root=None,
+    prototypes: int = 4,
+    embedding_backend: Optional[str] = None,
+    page_size: int = 512,
+) -> int:
+    """
+    Calcule les prototypes de la collection (k-means sphérique sur tous ses vecteurs) pour
+    le routeur de domaines du retriever (voir retrievers/domain_router.py). Renvoie le
+    nombre de prototypes écrits dans ``<root>/<collection>.json``. Le fichier note le modèle
+    (``embedding_backend``) : le retriever ignore les centroïdes d'un autre espace de vecteurs.
+    """
+    rows = [point.vector for point in _scroll(client, collection, page_size, with_payload=False)]
+    if not rows:
+        logger.info("%s: collection vide, pas de centroïdes", collection)
+        return 0
+    vectors = np.asarray(rows, dtype=np.float32).reshape(len(rows), -1)
+    centroids = compute_prototypes(vectors, k=prototypes)
+    path = save_centroids(
+        root or CENTROIDS_DIR, collection, centroids, len(rows), embedder_name(embedding_backend)
+    )
+    logger.info("%s: %d prototypes (%d vecteurs) -> %s", collection, len(centroids), len(rows), path)
+    return len(centroids)
+
+
+def _scroll(client, collection: str, page_size: int, with_payload: bool):
+    offset = None
+    while True:
+        batch, offset = client.scroll(
+            collection_name=collection,
+            limit=page_size,
+            offset=offset,
+            with_payload=with_payload,
+            with_vectors=True,
+        )
+        yield from batch
+        if offset is None:
+            break
+
+
+def _only_new_chunks(
+    docs: Iterable[Dict[str, str]], known: Set[str], current: Dict[str, List[str]]
+) -> Iterator[Dict[str, str]]:
+    """Calcule hash + ID de chaque chunk, note l'état courant, ne laisse passer que les nouveaux."""
     for doc in docs:
-        batch.append(doc)
-        if len(batch) >= batch_size:
-            total += _upsert_batch(client, collection, batch, model, now, domain)
-            batch = []
+        chunk = dict(doc)
+        chunk["chunk_hash"] = chunk_hash(chunk.get("text", ""))
+        pid = point_id(chunk)
+        current.setdefault(str(chunk.get("doc_id")), []).append(pid)
+        if pid in known:
+            continue
+        yield chunk
 
-    if batch:
-        total += _upsert_batch(client, collection, batch, model, now, domain)
 
-    return total
+def _put(q: "queue.Queue", item, stop: threading.Event) -> None:
+    """put() bloquant mais interruptible si un autre étage a échoué."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
 
 
-def _upsert_batch(client, collection, batch, model, timestamp, domain):
+def _barrier(client, collection: str, points: Optional[list]) -> None:
+    # Les opérations d'une collection sont appliquées dans l'ordre du WAL :
+    # un upsert idempotent en wait=True revient quand tous les précédents sont appliqués.
+    if points:
+        client.upsert(collection_name=collection, points=points, wait=True)
+
+
+def _build_points(batch, model, timestamp, domain, embedding_store=None):
     texts = [doc["text"] for doc in batch]
-    vectors = model.encode(texts).tolist()
+    if embedding_store is not None:
+        keys = [doc.get("chunk_hash") for doc in batch]
+        vectors = embedding_store.encode(texts, model, keys=keys if all(keys) else None).tolist()
+    else:
+        vectors = model.encode(texts).tolist()
 
     points = []
     for doc, vector in zip(batch, vectors):
         payload = dict(doc)
         payload.setdefault("domain", domain)
         payload["created_at"] = timestamp
-        pid = str(uuid.uuid4())
-        points.append(qm.PointStruct(id=pid, vector=vector, payload=payload))
+        points.append(qm.PointStruct(id=point_id(payload), vector=vector, payload=payload))
+    return points
 
-    client.upsert(collection_name=collection, points=points)
-    return len(points)
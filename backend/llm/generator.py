@@ -1,17 +1,40 @@
 """LLM generation helpers for FarmLink using the shared Mistral endpoint."""
 
+import asyncio
+import importlib.util
 import json
 import logging
 import os
+import random
 import textwrap
-from typing import Optional
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, Optional
 
-import requests
+import httpx
 
 LOGGER = logging.getLogger(__name__)
 DEFAULT_MODEL = os.getenv("LLM_MODEL", "mistral-small")
 DEFAULT_PROVIDER = "mistral"
 TIMEOUT = int(os.getenv("LLM_TIMEOUT", "60"))
+MISTRAL_URL = "https://api.mistral.ai/v1/chat/completions"
+
+# Pooled keep-alive HTTP clients (one sync, one async) shared by every call.
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 needs the optional ``h2`` package (httpx[http2]).
+HTTP2 = os.getenv("LLM_HTTP2", "1").strip() != "0" and importlib.util.find_spec("h2") is not None
+# Retries on 429/5xx and on requests that never left: jittered exponential backoff, Retry-After honoured.
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "0.5"))
+RETRY_MAX_WAIT = float(os.getenv("LLM_RETRY_MAX_WAIT", "10"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Only errors raised before the POST reached Mistral: a read timeout or a dropped
+# connection may follow a billed completion, and retrying it would stretch the call
+# to several LLM_TIMEOUTs.
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
 
 # ⚠️ NOUVEAU SYSTEM PROMPT (plus de 60/40, contexte uniquement, sources max 3)
 SYSTEM_PROMPT = textwrap.dedent(
@@ -61,6 +84,18 @@ SYSTEM_PROMPT = textwrap.dedent(
 )
 
 
+FALLBACK_PREFIX = "Mode hors ligne"
+
+
+class StreamInterrupted(RuntimeError):
+    """Mistral failed after part of the answer was streamed; the text received so far is incomplete."""
+
+
+def is_fallback_answer(answer: str) -> bool:
+    """True when the answer comes from the offline formatter rather than the LLM."""
+    return (answer or "").startswith(FALLBACK_PREFIX)
+
+
 def _get_api_key() -> Optional[str]:
     key = os.getenv("LLM_API_KEY")
     if key:
@@ -86,8 +121,7 @@ def generate_answer(prompt: str, temperature: float = 0.2, provider: Optional[st
         return _fallback_answer(prompt)
 
 
-def _call_mistral(prompt: str, temperature: float, api_key: str) -> str:
-    url = "https://api.mistral.ai/v1/chat/completions"
+def _mistral_request(prompt: str, temperature: float, api_key: str) -> Dict:
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
@@ -100,12 +134,250 @@ def _call_mistral(prompt: str, temperature: float, api_key: str) -> str:
             {"role": "user", "content": prompt},
         ],
     }
-    response = requests.post(url, headers=headers, data=json.dumps(payload), timeout=TIMEOUT)
+    return {"headers": headers, "payload": payload}
+
+
+def _call_mistral(prompt: str, temperature: float, api_key: str) -> str:
+    req = _mistral_request(prompt, temperature, api_key)
+    client = _get_client()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = client.post(
+                MISTRAL_URL, headers=req["headers"], json=req["payload"], extensions=_trace_extensions()
+            )
+        except RETRY_EXCEPTIONS as exc:
+            if attempt >= MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt, None)
+            LOGGER.info("Mistral connection error (%s), retry in %.2fs", exc, delay)
+        else:
+            _record("requests")
+            if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                break
+            delay = _retry_delay(attempt, response)
+            LOGGER.info("Mistral HTTP %s, retry in %.2fs", response.status_code, delay)
+        _record("retries")
+        time.sleep(delay)
+    response.raise_for_status()
+    data = response.json()
+    return data["choices"][0]["message"]["content"].strip()
+
+
+# ===== Connection pool, retry policy and reuse metrics =====
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_client_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_HTTP_STATS = {
+    "requests": 0,
+    "retries": 0,
+    "new_connections": 0,
+    "tls_handshakes": 0,
+    "http2_requests": 0,
+}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _get_client() -> httpx.Client:
+    global _client
+    if _client is None or _client.is_closed:
+        with _client_lock:
+            if _client is None or _client.is_closed:
+                _client = httpx.Client(timeout=TIMEOUT, limits=_limits(), http2=HTTP2)
+    return _client
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Shared AsyncClient, created lazily inside the running event loop."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(timeout=TIMEOUT, limits=_limits(), http2=HTTP2)
+    return _async_client
+
+
+async def aclose() -> None:
+    global _async_client, _client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def _record(key: str) -> None:
+    with _stats_lock:
+        _HTTP_STATS[key] += 1
+
+
+def _on_trace(event: str) -> None:
+    # httpcore trace events: a TCP connect / TLS handshake only happens on a new connection.
+    if event == "connection.connect_tcp.complete":
+        _record("new_connections")
+    elif event == "connection.start_tls.complete":
+        _record("tls_handshakes")
+    elif event == "http2.send_request_headers.started":
+        _record("http2_requests")
+
+
+def _trace(event: str, info: Dict) -> None:
+    _on_trace(event)
+
+
+async def _atrace(event: str, info: Dict) -> None:
+    _on_trace(event)
+
+
+def _trace_extensions() -> Dict:
+    return {"trace": _trace}
+
+
+def _atrace_extensions() -> Dict:
+    return {"trace": _atrace}
+
+
+def http_stats() -> Dict:
+    """Connection reuse counters for the Mistral client (exposed on /stats)."""
+    with _stats_lock:
+        stats = dict(_HTTP_STATS)
+    reused = max(0, stats["requests"] - stats["new_connections"])
+    stats["reused_connections"] = reused
+    stats["reuse_rate"] = round(reused / stats["requests"], 4) if stats["requests"] else 0.0
+    stats["http2_enabled"] = HTTP2
+    return stats
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    """Seconds to wait before the next attempt: Retry-After if given, else full-jitter backoff."""
+    if response is not None:
+        retry_after = (response.headers.get("Retry-After") or "").strip()
+        if retry_after:
+            try:
+                return min(RETRY_MAX_WAIT, max(0.0, float(retry_after)))
+            except ValueError:
+                try:
+                    return min(RETRY_MAX_WAIT, max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+    return random.uniform(0, min(RETRY_MAX_WAIT, RETRY_BASE * (2 ** attempt)))
+
+
+async def _asend(request: httpx.Request, stream: bool = False) -> httpx.Response:
+    """Send ``request`` on the shared AsyncClient with the retry policy applied."""
+    client = _get_async_client()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await client.send(request, stream=stream)
+        except RETRY_EXCEPTIONS as exc:
+            if attempt >= MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt, None)
+            LOGGER.info("Mistral connection error (%s), retry in %.2fs", exc, delay)
+        else:
+            _record("requests")
+            if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                return response
+            delay = _retry_delay(attempt, response)
+            LOGGER.info("Mistral HTTP %s, retry in %.2fs", response.status_code, delay)
+            await response.aclose()
+        _record("retries")
+        await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")  # pragma: no cover
+
+
+async def agenerate_answer(prompt: str, temperature: float = 0.2, provider: Optional[str] = None) -> str:
+    """Async twin of generate_answer: the event loop is never blocked on Mistral."""
+    provider = (provider or DEFAULT_PROVIDER).lower().strip()
+    if provider != "mistral":
+        LOGGER.warning("Unsupported LLM provider '%s'; only 'mistral' is available.", provider)
+        return _fallback_answer(prompt)
+
+    api_key = _get_api_key()
+    if not api_key:
+        LOGGER.warning("LLM_API_KEY missing for Mistral, using fallback formatter.")
+        return _fallback_answer(prompt)
+
+    try:
+        return await _acall_mistral(prompt, temperature, api_key)
+    except Exception as exc:  # pragma: no cover - network defensive
+        LOGGER.warning("Mistral API call failed: %s", exc)
+        return _fallback_answer(prompt)
+
+
+async def _acall_mistral(prompt: str, temperature: float, api_key: str) -> str:
+    req = _mistral_request(prompt, temperature, api_key)
+    request = _get_async_client().build_request(
+        "POST", MISTRAL_URL, headers=req["headers"], json=req["payload"], extensions=_atrace_extensions()
+    )
+    response = await _asend(request)
     response.raise_for_status()
     data = response.json()
     return data["choices"][0]["message"]["content"].strip()
 
 
+async def astream_answer(
+    prompt: str, temperature: float = 0.2, provider: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Yield the answer as text deltas (Mistral ``stream: true``); fallback text is yielded whole.
+
+    A failure before the first delta falls back to the offline formatter; a failure after it
+    raises ``StreamInterrupted`` so the caller neither shows nor caches the truncated text as final.
+    """
+    provider = (provider or DEFAULT_PROVIDER).lower().strip()
+    if provider != "mistral":
+        LOGGER.warning("Unsupported LLM provider '%s'; only 'mistral' is available.", provider)
+        yield _fallback_answer(prompt)
+        return
+
+    api_key = _get_api_key()
+    if not api_key:
+        LOGGER.warning("LLM_API_KEY missing for Mistral, using fallback formatter.")
+        yield _fallback_answer(prompt)
+        return
+
+    sent_any = False
+    try:
+        async for delta in _astream_mistral(prompt, temperature, api_key):
+            sent_any = True
+            yield delta
+    except Exception as exc:  # pragma: no cover - network defensive
+        LOGGER.warning("Mistral streaming call failed: %s", exc)
+        if sent_any:
+            raise StreamInterrupted(str(exc)) from exc
+        yield _fallback_answer(prompt)
+
+
+async def _astream_mistral(prompt: str, temperature: float, api_key: str) -> AsyncIterator[str]:
+    req = _mistral_request(prompt, temperature, api_key)
+    payload = dict(req["payload"], stream=True)
+    request = _get_async_client().build_request(
+        "POST", MISTRAL_URL, headers=req["headers"], json=payload, extensions=_atrace_extensions()
+    )
+    response = await _asend(request, stream=True)
+    try:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            choices = chunk.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+    finally:
+        await response.aclose()
+
+
 def _fallback_answer(prompt: str) -> str:
     # Fallback hors-ligne: synthèse brute des extraits CONTEXTE si présents
     context_section = ""
@@ -118,11 +390,11 @@ def _fallback_answer(prompt: str) -> str:
             bullets.append(line[2:])
     if not bullets:
         return (
-            "Mode hors ligne : aucune donnée du corpus n'est disponible pour répondre. "
+            f"{FALLBACK_PREFIX} : aucune donnée du corpus n'est disponible pour répondre. "
             "Merci de réessayer plus tard ou de préciser votre question."
         )
     summary = "\n".join(f"- {item}" for item in bullets[:4])
     return (
-        "Mode hors ligne : synthèse des extraits pertinents du corpus FarmLink :\n"
+        f"{FALLBACK_PREFIX} : synthèse des extraits pertinents du corpus FarmLink :\n"
         f"{summary}\n\nSources : extraits fournis dans le CONTEXTE (max 3 titres)."
     )
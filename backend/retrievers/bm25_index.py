@@ -0,0 +1,113 @@
+"""Okapi BM25 inverted index over the chunks of a local snapshot.
+
+Built at export time next to the dense snapshot (see retrievers/local_index.py),
+with rows in the same order as ``points.json``. Postings are stored in CSR form
+in ``bm25.npz``:
+
+- ``terms``: sorted vocabulary (``common.text.tokenize`` tokens);
+- ``indptr``: postings of ``terms[i]`` are ``rows/tfs[indptr[i]:indptr[i + 1]]``;
+- ``rows``, ``tfs``: chunk row and term frequency of each posting;
+- ``doc_lengths``: token count of every chunk.
+
+Scoring a query touches only the postings of its terms, in numpy.
+"""
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+BM25_FILE = "bm25.npz"
+
+
+class BM25Index:
+    def __init__(
+        self,
+        terms: Sequence[str],
+        indptr: np.ndarray,
+        rows: np.ndarray,
+        tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.rows = rows
+        self.tfs = tfs.astype(np.float32)
+        self.doc_lengths = doc_lengths.astype(np.float32)
+        self.k1 = k1
+        self.b = b
+        count = len(doc_lengths)
+        average = float(self.doc_lengths.mean()) if count else 0.0
+        # Per-chunk length normalisation of BM25, computed once.
+        self._norm = k1 * (1 - b + b * self.doc_lengths / (average or 1.0))
+        df = np.diff(indptr).astype(np.float32)
+        self.idf = np.log1p((count - df + 0.5) / (df + 0.5))
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, documents: Sequence[Sequence[str]], **params) -> "BM25Index":
+        """Index tokenised documents; row ``i`` of the index is ``documents[i]``."""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = np.zeros(len(documents), dtype=np.int32)
+        for row, tokens in enumerate(documents):
+            lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((row, tf))
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            indptr[i + 1] = indptr[i] + len(postings[term])
+        rows = np.fromiter((r for t in terms for r, _ in postings[t]), dtype=np.int32, count=int(indptr[-1]))
+        tfs = np.fromiter((f for t in terms for _, f in postings[t]), dtype=np.int32, count=int(indptr[-1]))
+        return cls(terms, indptr, rows, tfs, lengths, **params)
+
+    def save(self, path) -> None:
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez(
+            Path(path) / BM25_FILE,
+            terms=np.array(terms, dtype=str),
+            indptr=self.indptr,
+            rows=self.rows,
+            tfs=self.tfs.astype(np.int32),
+            doc_lengths=self.doc_lengths.astype(np.int32),
+        )
+
+    @classmethod
+    def load(cls, path, **params) -> "BM25Index":
+        with np.load(Path(path) / BM25_FILE, allow_pickle=False) as data:
+            return cls(
+                data["terms"].tolist(),
+                data["indptr"],
+                data["rows"],
+                data["tfs"],
+                data["doc_lengths"],
+                **params,
+            )
+
+    def scores(self, tokens: Sequence[str]) -> np.ndarray:
+        out = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for term in set(tokens):
+            i = self.vocabulary.get(term)
+            if i is None:
+                continue
+            start, end = self.indptr[i], self.indptr[i + 1]
+            rows, tf = self.rows[start:end], self.tfs[start:end]
+            out[rows] += self.idf[i] * tf * (self.k1 + 1) / (tf + self._norm[rows])
+        return out
+
+    def search(self, tokens: Sequence[str], top_k: int) -> List[Tuple[int, float]]:
+        """Top-``top_k`` ``(row, score)`` pairs; chunks sharing no term with the query are left out."""
+        if top_k <= 0 or not len(self.doc_lengths):
+            return []
+        scores = self.scores(tokens)
+        matched = np.flatnonzero(scores > 0)
+        if not len(matched):
+            return []
+        k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(row), float(scores[row])) for row in top]
@@ -0,0 +1,166 @@
+"""Embedding-centroid domain router: picks the collections worth searching for a query.
+
+At ingest time every collection gets a small set of prototypes, the centroids of
+a spherical k-means over its chunk vectors, saved as
+``<root>/<collection>.json`` (see ``ingest/ingest_qdrant_core.export_centroids``)::
+
+    {"collection": ..., "model": ..., "count": ..., "updated_at": ..., "prototypes": [[...], ...]}
+
+A collection's affinity with a query is the best cosine between the query
+vector and its prototypes. The router only narrows the search when it is
+confident: a clear winner gives one collection, a clear pair gives two,
+anything else lets the caller fan out to every collection.
+"""
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def compute_prototypes(vectors: np.ndarray, k: int = 4, iterations: int = 15, seed: int = 0) -> np.ndarray:
+    """Spherical k-means: ``min(k, n)`` L2-normalised prototypes of the (normalised) rows."""
+    vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+    if not len(vectors):
+        return vectors
+    k = max(1, min(int(k), len(vectors)))
+    if k == 1:
+        return _normalize_rows(vectors.mean(axis=0, keepdims=True))
+    rng = np.random.default_rng(seed)
+    prototypes = vectors[rng.choice(len(vectors), size=k, replace=False)]
+    for _ in range(iterations):
+        assignment = (vectors @ prototypes.T).argmax(axis=1)
+        updated = prototypes.copy()
+        for cluster in range(k):
+            members = vectors[assignment == cluster]
+            if len(members):
+                updated[cluster] = members.sum(axis=0)
+        updated = _normalize_rows(updated)
+        if np.allclose(updated, prototypes, atol=1e-6):
+            break
+        prototypes = updated
+    return prototypes
+
+
+def save_centroids(root, collection: str, prototypes: np.ndarray, count: int, model: str) -> Path:
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    path = root / f"{collection}.json"
+    tmp = path.with_suffix(".json.tmp")
+    payload = {
+        "collection": collection,
+        "model": model,
+        "count": int(count),
+        "updated_at": datetime.utcnow().isoformat(),
+        "prototypes": np.round(np.asarray(prototypes, dtype=np.float32), 6).tolist(),
+    }
+    tmp.write_text(json.dumps(payload), encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+
+class DomainRouter:
+    def __init__(
+        self,
+        prototypes: Dict[str, np.ndarray],
+        min_score: float = 0.25,
+        margin: float = 0.05,
+        max_collections: int = 2,
+    ):
+        self.collections = sorted(prototypes)
+        self.min_score = min_score
+        self.margin = margin
+        self.max_collections = max(1, int(max_collections))
+        rows = [_normalize_rows(np.asarray(prototypes[c], dtype=np.float32)) for c in self.collections]
+        self._matrix = np.concatenate(rows) if rows else np.zeros((0, 0), np.float32)
+        self._owner = np.concatenate(
+            [np.full(len(r), i, dtype=np.int32) for i, r in enumerate(rows)]
+        ) if rows else np.zeros(0, np.int32)
+        self.decisions = {"single": 0, "pair": 0, "fanout": 0}
+
+    def __len__(self) -> int:
+        return len(self.collections)
+
+    @classmethod
+    def load(cls, root, collections: Iterable[str], model: Optional[str] = None, **params) -> "DomainRouter":
+        """Prototypes of ``collections`` found under ``root``; files built by another model are ignored."""
+        prototypes: Dict[str, np.ndarray] = {}
+        for collection in collections:
+            path = Path(root) / f"{collection}.json"
+            if not path.exists():
+                continue
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                if model and _base_model(data.get("model", "")) != _base_model(model):
+                    logger.warning("Centroids of %s were built with %s, skipped", collection, data.get("model"))
+                    continue
+                prototypes[collection] = np.asarray(data["prototypes"], dtype=np.float32)
+            except (OSError, ValueError, KeyError) as exc:  # pragma: no cover - defensive
+                logger.warning("Centroids %s could not be loaded: %s", path, exc)
+        return cls(prototypes, **params)
+
+    def scores(self, vector: Sequence[float]) -> List[Tuple[str, float]]:
+        """``(collection, best prototype cosine)`` for every collection, best first."""
+        if not len(self._matrix):
+            return []
+        sims = self._matrix @ np.asarray(vector, dtype=np.float32)
+        best = np.full(len(self.collections), -np.inf, dtype=np.float32)
+        np.maximum.at(best, self._owner, sims)
+        order = np.argsort(-best, kind="stable")
+        return [(self.collections[i], float(best[i])) for i in order]
+
+    def route(self, vector: Sequence[float], candidates: Optional[Sequence[str]] = None) -> Optional[List[str]]:
+        """One or two collections to search, or ``None`` when every collection should be searched.
+
+        ``candidates`` restricts the decision to the collections that can actually be
+        searched; a candidate without prototypes forces the fan-out (it cannot be ruled out).
+        """
+        if candidates is not None and any(c not in self.collections for c in candidates):
+            self.decisions["fanout"] += 1
+            return None
+        ranked = [(c, s) for c, s in self.scores(vector) if candidates is None or c in candidates]
+        if len(ranked) < 2:
+            self.decisions["fanout"] += 1
+            return None
+        scores = [s for _, s in ranked] + [-np.inf]
+        if scores[0] >= self.min_score and scores[0] - scores[1] >= self.margin:
+            self.decisions["single"] += 1
+            return [ranked[0][0]]
+        if (
+            self.max_collections >= 2
+            and len(ranked) > 2
+            and scores[1] >= self.min_score
+            and scores[1] - scores[2] >= self.margin
+        ):
+            self.decisions["pair"] += 1
+            return [ranked[0][0], ranked[1][0]]
+        self.decisions["fanout"] += 1
+        return None
+
+    def stats(self) -> Dict:
+        total = sum(self.decisions.values())
+        return {
+            "collections": self.collections,
+            "prototypes": int(len(self._matrix)),
+            "min_score": self.min_score,
+            "margin": self.margin,
+            "decisions": dict(self.decisions),
+            "narrowed_rate": round(1 - self.decisions["fanout"] / total, 4) if total else 0.0,
+        }
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    if not len(matrix):
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _base_model(name: str) -> str:
+    # "<model>@onnx-int8" and "<model>" share the same vector space.
+    return name.split("@", 1)[0]
@@ -0,0 +1,279 @@
+"""Save local copies of the embedding model for fast, offline cold starts.
+
+Usage (from backend/)::
+
+    # sentence-transformers copy, for EMB_MODEL_PATH (torch backend)
+    python -m retrievers.export_model --out data/models/all-MiniLM-L6-v2
+
+    # int8 ONNX export, for EMBEDDING_BACKEND=onnx; --check compares it with torch
+    python -m retrievers.export_model --onnx --out data/models/all-MiniLM-L6-v2-onnx --check
+
+    # same for the cross-encoder of RERANK=1 (RERANK_MODEL_PATH / RERANK_ONNX_PATH)
+    python -m retrievers.export_model --rerank --onnx --check
+
+The ONNX graph stops at the transformer's last hidden state: mean pooling and
+normalisation are done in numpy by ``common.embeddings.OnnxEmbedder``. The
+cross-encoder graph outputs its relevance logits (``retrievers.reranker.OnnxCrossEncoder``).
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from common.embeddings import (
+    CONFIG_FILE,
+    EMB_DIM,
+    EMB_NAME,
+    MAX_SEQ_LENGTH,
+    ONNX_MODEL_FILE,
+    TOKENIZER_FILE,
+    OnnxEmbedder,
+)
+from retrievers.reranker import RERANK_MAX_LENGTH, RERANK_MODEL, OnnxCrossEncoder
+
+# Phrases de contrôle pour --check : questions courtes et passages du corpus.
+PARITY_TEXTS = [
+    "bonjour",
+    "Quel est le meilleur moment pour semer le maïs ?",
+    "Comment corriger un sol trop acide avant la plantation du manioc ?",
+    "prix du cacao sur le marché de Bouaké cette semaine",
+    "Irrigation goutte à goutte : quel débit pour une parcelle de tomates d'un hectare ?",
+    "Entretien du moteur d'un motoculteur après la saison des pluies.",
+    "Le chaulage consiste à apporter de la chaux pour relever le pH du sol et améliorer "
+    "la disponibilité du phosphore. On l'applique de préférence plusieurs semaines avant "
+    "le semis, en incorporant le produit dans les vingt premiers centimètres.",
+    "How much nitrogen does a rice crop need per hectare?",
+]
+
+
+def export_sentence_transformer(out_dir: str, model_name: str = EMB_NAME) -> str:
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    model.save(out_dir)
+    return out_dir
+
+
+def export_onnx(out_dir: str, model_name: str = EMB_NAME, quantize: bool = True, opset: int = 14) -> str:
+    """Export the MiniLM transformer to ONNX, then quantize its weights to int8 (dynamic)."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    st.tokenizer.backend_tokenizer.save(str(out / TOKENIZER_FILE))
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    sample = st.tokenizer(["exemple de phrase", "un autre exemple"], padding=True, return_tensors="pt")
+    fp32_path = out / "model_fp32.onnx"
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder(transformer),
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            str(fp32_path),
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": axes,
+                "attention_mask": axes,
+                "token_type_ids": axes,
+                "last_hidden_state": axes,
+            },
+            opset_version=opset,
+        )
+
+    model_file = fp32_path.name
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(fp32_path), str(out / ONNX_MODEL_FILE), weight_type=QuantType.QInt8)
+        fp32_path.unlink()
+        model_file = ONNX_MODEL_FILE
+
+    config = {
+        "model": model_name,
+        "model_file": model_file,
+        "weights": "int8" if quantize else "fp32",
+        "dim": EMB_DIM,
+        "max_seq_length": int(getattr(st, "max_seq_length", None) or MAX_SEQ_LENGTH),
+        "pad_token": st.tokenizer.pad_token or "[PAD]",
+    }
+    (out / CONFIG_FILE).write_text(json.dumps(config, indent=1), encoding="utf-8")
+    return str(out)
+
+
+def export_cross_encoder(out_dir: str, model_name: str = RERANK_MODEL) -> str:
+    from sentence_transformers import CrossEncoder
+
+    CrossEncoder(model_name, max_length=RERANK_MAX_LENGTH).save(out_dir)
+    return out_dir
+
+
+def export_reranker_onnx(
+    out_dir: str, model_name: str = RERANK_MODEL, quantize: bool = True, opset: int = 14
+) -> str:
+    """Export the cross-encoder (sequence classification head included) to ONNX, int8 weights."""
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    ce = CrossEncoder(model_name, max_length=RERANK_MAX_LENGTH, device="cpu")
+    model, tokenizer = ce.model.eval(), ce.tokenizer
+    tokenizer.backend_tokenizer.save(str(out / TOKENIZER_FILE))
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in tokenizer.model_input_names]
+
+    class _Scorer(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(names, inputs))).logits
+
+    sample = tokenizer(
+        [("question", "un passage"), ("autre question", "un autre passage")], padding=True, return_tensors="pt"
+    )
+    fp32_path = out / "model_fp32.onnx"
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            _Scorer(model),
+            tuple(sample[n] for n in names),
+            str(fp32_path),
+            input_names=names,
+            output_names=["logits"],
+            dynamic_axes={**{n: axes for n in names}, "logits": {0: "batch"}},
+            opset_version=opset,
+        )
+
+    model_file = fp32_path.name
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(fp32_path), str(out / ONNX_MODEL_FILE), weight_type=QuantType.QInt8)
+        fp32_path.unlink()
+        model_file = ONNX_MODEL_FILE
+
+    config = {
+        "model": model_name,
+        "model_file": model_file,
+        "weights": "int8" if quantize else "fp32",
+        "max_seq_length": RERANK_MAX_LENGTH,
+        "pad_token": tokenizer.pad_token or "<pad>",
+    }
+    (out / CONFIG_FILE).write_text(json.dumps(config, indent=1), encoding="utf-8")
+    return str(out)
+
+
+def check_rerank_parity(onnx_dir: str, model_name: str = RERANK_MODEL) -> Dict[str, float]:
+    """Torch vs ONNX cross-encoder on PARITY_TEXTS pairs: score gap and per-question top-1 agreement."""
+    from sentence_transformers import CrossEncoder
+
+    questions, passages = PARITY_TEXTS[:4], PARITY_TEXTS[4:]
+    pairs = [(q, p) for q in questions for p in passages]
+    reference = np.asarray(CrossEncoder(model_name, max_length=RERANK_MAX_LENGTH).predict(pairs)).reshape(-1)
+    candidate = OnnxCrossEncoder(onnx_dir).predict(pairs)
+    ref, cand = reference.reshape(len(questions), -1), candidate.reshape(len(questions), -1)
+    return {
+        "max_abs_diff": round(float(np.abs(reference - candidate).max()), 5),
+        "top1_agreement": round(float(np.mean(ref.argmax(axis=1) == cand.argmax(axis=1))), 3),
+    }
+
+
+def check_parity(
+    onnx_dir: str,
+    model_name: str = EMB_NAME,
+    texts: Optional[Sequence[str]] = None,
+) -> Dict[str, float]:
+    """Cosine between torch and ONNX vectors of the same texts, plus top-1 neighbour agreement."""
+    from sentence_transformers import SentenceTransformer
+
+    texts = list(texts or PARITY_TEXTS)
+    reference = SentenceTransformer(model_name, device="cpu").encode(texts, normalize_embeddings=True)
+    candidate = OnnxEmbedder(onnx_dir).encode(texts)
+    cosines = np.sum(reference * candidate, axis=1)
+    # Même plus proche voisin (hors soi-même) dans les deux espaces ?
+    ref_sim, cand_sim = reference @ reference.T, candidate @ reference.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(cand_sim, -np.inf)
+    agreement = float(np.mean(ref_sim.argmax(axis=1) == cand_sim.argmax(axis=1)))
+    return {
+        "min_cosine": round(float(cosines.min()), 5),
+        "mean_cosine": round(float(cosines.mean()), 5),
+        "top1_agreement": round(agreement, 3),
+    }
+
+
+def _check_top1(report: Dict[str, float], min_top1: float) -> None:
+    # Une inversion isolée entre deux voisins très proches est attendue après quantification int8 :
+    # simple avertissement, échec seulement sous --min-top1.
+    agreement = report["top1_agreement"]
+    if agreement < min_top1:
+        sys.exit(f"Parité insuffisante (accord top-1 {agreement} < {min_top1})")
+    if agreement < 1.0:
+        print(f"Attention : accord top-1 {agreement} (< 1.0, toléré jusqu'à {min_top1})")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default=None, help="Dossier de sortie")
+    ap.add_argument("--model", default=None, help=f"Défaut: {EMB_NAME} (ou {RERANK_MODEL} avec --rerank)")
+    ap.add_argument(
+        "--rerank", action="store_true", help="Exporte le cross-encoder de RERANK=1 au lieu de l'embedder"
+    )
+    ap.add_argument("--onnx", action="store_true", help="Export ONNX (int8) pour EMBEDDING_BACKEND=onnx")
+    ap.add_argument("--no-quantize", action="store_true", help="Garde les poids ONNX en float32")
+    ap.add_argument("--check", action="store_true", help="Compare les vecteurs ONNX à ceux de torch")
+    ap.add_argument("--min-cosine", type=float, default=0.98, help="Seuil de --check (cosinus minimal)")
+    ap.add_argument(
+        "--min-top1",
+        type=float,
+        default=0.75,
+        help="Seuil de --check : part minimale de plus proches voisins (ou meilleurs passages) identiques",
+    )
+    args = ap.parse_args()
+
+    if args.rerank:
+        model = args.model or RERANK_MODEL
+        if not args.onnx:
+            out = export_cross_encoder(args.out or "data/models/reranker", model)
+            print(f"Cross-encoder sauvegardé -> {out}")
+            sys.exit(0)
+        out = export_reranker_onnx(args.out or "data/models/reranker-onnx", model, quantize=not args.no_quantize)
+        print(f"Cross-encoder ONNX sauvegardé -> {out}")
+        if args.check:
+            report = check_rerank_parity(out, model)
+            print(f"Parité torch/ONNX: {report}")
+            _check_top1(report, args.min_top1)
+        sys.exit(0)
+
+    args.model = args.model or EMB_NAME
+    if not args.onnx:
+        out = export_sentence_transformer(args.out or "data/models/all-MiniLM-L6-v2", args.model)
+        print(f"Modèle sauvegardé -> {out}")
+        sys.exit(0)
+
+    out = export_onnx(args.out or "data/models/all-MiniLM-L6-v2-onnx", args.model, quantize=not args.no_quantize)
+    print(f"Modèle ONNX sauvegardé -> {out}")
+    if args.check:
+        report = check_parity(out, args.model)
+        print(f"Parité torch/ONNX: {report}")
+        if report["min_cosine"] < args.min_cosine:
+            sys.exit(f"Parité insuffisante (cosinus minimal attendu {args.min_cosine})")
+        _check_top1(report, args.min_top1)
@@ -0,0 +1,90 @@
+"""In-process vector index built from a snapshot exported at ingest time.
+
+A snapshot directory ``<root>/<collection>/`` contains:
+
+- ``vectors.npy``: float32 matrix of L2-normalised vectors, loaded with ``mmap_mode="r"``;
+- ``points.json``: ``[{"id": ..., "payload": {...}}, ...]`` in the same row order;
+- ``bm25.npz`` (optional): BM25 inverted index over the same rows (see retrievers/bm25_index.py).
+
+The whole FarmLink corpus is a few thousand 384-d vectors, so an exact
+matrix-vector product is well under a millisecond.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from qdrant_client.http import models as qm
+
+from retrievers.bm25_index import BM25_FILE, BM25Index
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+POINTS_FILE = "points.json"
+
+
+class LocalIndex:
+    def __init__(self, vectors: np.ndarray, points: List[Dict], bm25: Optional[BM25Index] = None):
+        if len(vectors) != len(points):
+            raise ValueError("vectors/points length mismatch")
+        if bm25 is not None and len(bm25) != len(points):
+            raise ValueError("bm25/points length mismatch")
+        self.vectors = vectors
+        self.points = points
+        self.bm25 = bm25
+
+    @classmethod
+    def load(cls, path) -> "LocalIndex":
+        path = Path(path)
+        vectors = np.load(path / VECTORS_FILE, mmap_mode="r")
+        with open(path / POINTS_FILE, "r", encoding="utf-8") as fh:
+            points = json.load(fh)
+        bm25 = BM25Index.load(path) if (path / BM25_FILE).exists() else None
+        return cls(vectors, points, bm25)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def search(self, vector: Sequence[float], top_k: int) -> List[qm.ScoredPoint]:
+        """Exact cosine top-k, returned as Qdrant ScoredPoints so callers format them uniformly."""
+        if not len(self.points) or top_k <= 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm:
+            query = query / norm
+        scores = self.vectors @ query
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self._point(i, float(scores[i])) for i in top]
+
+    def search_sparse(self, tokens: Sequence[str], top_k: int) -> List[qm.ScoredPoint]:
+        """BM25 top-k over the query tokens (empty when the snapshot has no BM25 index)."""
+        if self.bm25 is None:
+            return []
+        return [self._point(row, score) for row, score in self.bm25.search(tokens, top_k)]
+
+    def _point(self, row: int, score: float) -> qm.ScoredPoint:
+        return qm.ScoredPoint(
+            id=self.points[row]["id"],
+            version=0,
+            score=score,
+            payload=self.points[row].get("payload") or {},
+        )
+
+
+def load_local_indexes(root) -> Dict[str, LocalIndex]:
+    """Load every ``<root>/<collection>/`` snapshot; unreadable ones are skipped."""
+    root = Path(root)
+    indexes: Dict[str, LocalIndex] = {}
+    if not root.is_dir():
+        return indexes
+    for path in sorted(p for p in root.iterdir() if (p / VECTORS_FILE).exists()):
+        try:
+            indexes[path.name] = LocalIndex.load(path)
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.warning("Local index %s could not be loaded: %s", path, exc)
+    return indexes
@@ -1,20 +1,122 @@
 """Helpers for querying multiple Qdrant collections."""
+import asyncio
 import logging
-from typing import Dict, List
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Awaitable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
 
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http import models as qm
 
-EMB_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+from common.cache import LRUCache
+from common.embedding_batcher import EmbeddingBatcher
+from common.embeddings import load_embedder
+from common.text import normalize_question, tokenize
+from retrievers.domain_router import DomainRouter
+from retrievers.local_index import LocalIndex, load_local_indexes
+from retrievers.reranker import Reranker, load_scorer
+
+# Per-collection deadline (seconds) before a collection is dropped from the results.
+SEARCH_TIMEOUT = float(os.getenv("QDRANT_SEARCH_TIMEOUT", "5"))
+# "0" queries collections one after another (legacy behaviour), otherwise fan out concurrently.
+PARALLEL_SEARCH = os.getenv("QDRANT_PARALLEL_SEARCH", "1").strip() != "0"
+# Query-embedding cache: max entries (0 disables it) and optional TTL in seconds.
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "1024"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "0"))
+# Threads dedicated to model.encode on the async path (keeps the event loop free).
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))
+# Micro-batching of concurrent query encodes on the async path (EMBED_BATCH_WAIT_MS=0 disables it).
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+# gRPC multiplexes every collection search of an endpoint over a single HTTP/2 channel.
+PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "0").strip() == "1"
+# Local snapshot index: "off", "fallback" (used when Qdrant fails) or "primary" (no network).
+LOCAL_INDEX_MODE = (os.getenv("LOCAL_INDEX_MODE") or "off").strip().lower()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR") or str(
+    Path(__file__).resolve().parent.parent / "data" / "index"
+)
+# Hybrid retrieval: dense hits fused with the snapshot's BM25 hits by reciprocal rank fusion.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "0").strip() == "1"
+HYBRID_RRF_K = float(os.getenv("HYBRID_RRF_K", "60"))
+# Candidates fetched per collection and per retriever (dense, BM25) before fusion.
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+# Centroid domain router for domain="all" (see retrievers/domain_router.py): "0" disables it.
+DOMAIN_ROUTER = os.getenv("DOMAIN_ROUTER", "1").strip() != "0"
+CENTROIDS_DIR = os.getenv("CENTROIDS_DIR") or str(Path(__file__).resolve().parent.parent / "data" / "centroids")
+# Narrow the search only when the best collection scores at least ROUTER_MIN_SCORE and leads the
+# next one by ROUTER_MARGIN (cosines between the query and the collection prototypes).
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "0.25"))
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.05"))
+
+# Optional cross-encoder rerank (see retrievers/reranker.py): RERANK_CANDIDATES chunks are
+# fetched and rescored in one batch, the best RERANK_TOP_K (capped by top_k) are returned.
+RERANK = os.getenv("RERANK", "0").strip() == "1"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "3"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+# Seconds ("0" = no expiry). Keys hash the scored text, so an edited chunk is rescored anyway.
+RERANK_CACHE_TTL = float(os.getenv("RERANK_CACHE_TTL", "3600"))
+# Threads scoring pairs, apart from the query encodes (EMBED_WORKERS) so a batch never delays them.
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "1"))
+
+# Two-phase fetch: ids and scores first, payloads only for the global top_k ("0" disables it).
+TWO_PHASE_FETCH = os.getenv("RETRIEVER_TWO_PHASE", "1").strip() != "0"
+# Per-collection score normalisation before the global cut: "none" (raw cosine), "minmax" or "zscore".
+SCORE_NORMALIZATION = (os.getenv("RETRIEVER_SCORE_NORM") or "none").strip().lower()
+
+# Ingest-time chunk metadata (see ingest/chunkers.py), passed through when present.
+# doc_id/chunk_id let the prompt packer merge neighbouring chunks (common/context_packer.py).
+CHUNK_METADATA = ("doc_id", "chunk_id")
+# "1" reads the pre-trimmed "snippet" stored at ingest (--snippet-chars) instead of the full text.
+# Every point must carry one: the full text is not fetched in this mode.
+USE_SNIPPET = os.getenv("RETRIEVER_USE_SNIPPET", "0").strip() == "1"
+TEXT_FIELD = "snippet" if USE_SNIPPET else "text"
+# Payload fields requested from Qdrant ("*" for the whole payload): created_at, chunk_hash,
+# the full text in snippet mode... never leave the cluster. The keyword coverage check
+# tokenises the text that goes into the prompt (memoised), so "tokens" is not needed.
+_DEFAULT_FIELDS = ",".join((TEXT_FIELD, "title", "source", "domain", "doc_id", "chunk_id"))
+PAYLOAD_FIELDS = [
+    f.strip() for f in (os.getenv("RETRIEVER_PAYLOAD_FIELDS") or _DEFAULT_FIELDS).split(",") if f.strip()
+]
+PAYLOAD_SELECTOR = True if "*" in PAYLOAD_FIELDS else PAYLOAD_FIELDS
+
+# A collection name, "all", or the collections picked by the domain router.
+Domain = Union[str, Sequence[str]]
 
 logger = logging.getLogger(__name__)
 
 
 class MultiQdrantRetriever:
-    def __init__(self, endpoints: Dict[str, Dict]):
+    def __init__(
+        self,
+        endpoints: Dict[str, Dict],
+        timeout: Optional[float] = None,
+        parallel: Optional[bool] = None,
+        cache_size: Optional[int] = None,
+        local_mode: Optional[str] = None,
+        local_dir: Optional[str] = None,
+        hybrid: Optional[bool] = None,
+    ):
         """Initialise a retriever from a mapping of collection -> endpoint config."""
-        self.model = SentenceTransformer(EMB_NAME)
+        # Embedding backend picked by EMBEDDING_BACKEND (see common/embeddings.py).
+        self.model = load_embedder()
+        self.embedding_cache = LRUCache(
+            EMBED_CACHE_SIZE if cache_size is None else cache_size,
+            ttl=EMBED_CACHE_TTL,
+        )
         self.clients: Dict[str, QdrantClient] = {}
+        self.async_clients: Dict[str, AsyncQdrantClient] = {}
+        # Collections hosted on the same cluster share one client (and its connection pool).
+        self.endpoint_groups: Dict[Tuple[str, str], List[str]] = {}
+        self._shared_clients: Dict[Tuple[str, str], Tuple[QdrantClient, AsyncQdrantClient]] = {}
+        self.timeout = SEARCH_TIMEOUT if timeout is None else float(timeout)
+        self.parallel = PARALLEL_SEARCH if parallel is None else bool(parallel)
+        # Qdrant only accepts whole seconds for client/server side timeouts.
+        self._request_timeout = max(1, math.ceil(self.timeout))
 
         for collection, cfg in (endpoints or {}).items():
             cfg = cfg or {}
@@ -22,55 +124,701 @@ class MultiQdrantRetriever:
             api_key = (cfg.get("api_key") or "").strip()
             if not url or not api_key:
                 continue
+            endpoint = (url, api_key)
             try:
-                self.clients[collection] = QdrantClient(url=url, api_key=api_key)
+                if endpoint not in self._shared_clients:
+                    self._shared_clients[endpoint] = self._make_clients(url, api_key)
             except Exception as exc:  # pragma: no cover - defensive
                 logger.warning("Qdrant client init failed for %s: %s", collection, exc)
+                continue
+            self.clients[collection], self.async_clients[collection] = self._shared_clients[endpoint]
+            self.endpoint_groups.setdefault(endpoint, []).append(collection)
+
+        self.local_mode = (local_mode or LOCAL_INDEX_MODE).lower()
+        self.local_indexes: Dict[str, LocalIndex] = {}
+        if self.local_mode in ("fallback", "primary"):
+            self.local_indexes = load_local_indexes(local_dir or LOCAL_INDEX_DIR)
+            logger.info(
+                "Local index (%s mode): %s",
+                self.local_mode,
+                {name: len(index) for name, index in self.local_indexes.items()},
+            )
+
+        self.hybrid = HYBRID_SEARCH if hybrid is None else bool(hybrid)
+        # Snapshots that carry a BM25 index (any LOCAL_INDEX_MODE: only their sparse side is used).
+        self.sparse_indexes: Dict[str, LocalIndex] = {}
+        if self.hybrid:
+            snapshots = self.local_indexes or load_local_indexes(local_dir or LOCAL_INDEX_DIR)
+            self.sparse_indexes = {name: index for name, index in snapshots.items() if index.bm25 is not None}
+            logger.info("Hybrid search (RRF k=%g): BM25 for %s", HYBRID_RRF_K, sorted(self.sparse_indexes))
+
+        self.reranker: Optional[Reranker] = None
+        if RERANK:
+            self.reranker = Reranker(
+                load_scorer(),
+                cache_size=RERANK_CACHE_SIZE,
+                cache_ttl=RERANK_CACHE_TTL,
+                batch_size=RERANK_BATCH_SIZE,
+            )
+            logger.info("Cross-encoder rerank: %s (%s)", self.reranker.scorer.name, self.reranker.scorer.backend)
+
+        self.router: Optional[DomainRouter] = None
+        if DOMAIN_ROUTER:
+            router = DomainRouter.load(
+                CENTROIDS_DIR,
+                self.available_collections,
+                model=self.model.name,
+                min_score=ROUTER_MIN_SCORE,
+                margin=ROUTER_MARGIN,
+            )
+            if len(router):
+                self.router = router
+                logger.info("Domain router: prototypes for %s", router.collections)
 
-        if not self.clients:
+        if not self.clients and not self.local_indexes:
             logger.warning("MultiQdrantRetriever initialised with no active Qdrant endpoints.")
 
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if self.parallel and len(self.clients) > 1:
+            self._executor = ThreadPoolExecutor(
+                max_workers=len(self.clients),
+                thread_name_prefix="qdrant-search",
+            )
+        self._encode_executor = ThreadPoolExecutor(
+            max_workers=max(1, EMBED_WORKERS),
+            thread_name_prefix="embed",
+        )
+        # Threads only start on the first rerank: free when RERANK is off.
+        self._rerank_executor = ThreadPoolExecutor(
+            max_workers=max(1, RERANK_WORKERS),
+            thread_name_prefix="rerank",
+        )
+        self.embed_batcher: Optional[EmbeddingBatcher] = None
+        if EMBED_BATCH_WAIT_MS > 0 and EMBED_BATCH_MAX > 1:
+            self.embed_batcher = EmbeddingBatcher(
+                self.model.encode,
+                self._encode_executor,
+                max_batch=EMBED_BATCH_MAX,
+                max_wait_ms=EMBED_BATCH_WAIT_MS,
+                max_concurrency=max(1, EMBED_WORKERS),
+            )
+
+    def _make_clients(self, url: str, api_key: str) -> Tuple[QdrantClient, AsyncQdrantClient]:
+        options = {"url": url, "api_key": api_key, "timeout": self._request_timeout}
+        if PREFER_GRPC:
+            options["prefer_grpc"] = True
+        return QdrantClient(**options), AsyncQdrantClient(**options)
+
     @property
     def available_collections(self) -> List[str]:
-        return list(self.clients.keys())
+        remote = list(self.clients.keys())
+        return remote + [name for name in self.local_indexes if name not in self.clients]
 
-    def search(self, query: str, top_k: int = 4, domain: str = "all") -> List[Dict]:
-        if not self.clients:
-            return []
+    def search(self, query: str, top_k: int = 4, domain: Domain = "all") -> List[Dict]:
+        results, _ = self.search_with_status(query, top_k=top_k, domain=domain)
+        return results
 
-        vector = self.model.encode(query).tolist()
-        results: List[Dict] = []
+    def search_with_status(
+        self, query: str, top_k: int = 4, domain: Domain = "all"
+    ) -> Tuple[List[Dict], Dict[str, str]]:
+        """Search and also return the collections dropped (timeout/error) with the reason."""
+        collections = self._target_collections(domain)
+        if not collections:
+            return [], {}
+
+        vector = self.embed(query)
+        local, remote = self._split_local(collections)
+        pool = self._pool(top_k)
+        fetch_k = self._fetch_k(pool)
+        with_payload = not self._defer_payloads(remote, len(collections), pool)
+
+        if self._executor is not None and len(remote) > 1:
+            hits_by_collection, skipped = self._search_parallel(remote, vector, fetch_k, with_payload)
+        else:
+            hits_by_collection, skipped = self._search_sequential(remote, vector, fetch_k, with_payload)
+        for collection in local:
+            hits_by_collection[collection] = self.local_indexes[collection].search(vector, fetch_k)
+        self._recover_locally(vector, fetch_k, hits_by_collection, skipped)
+
+        winners = self._select(collections, hits_by_collection, pool, query)
+        results = self._format(self._hydrate(winners, skipped))
+        if self.reranker is not None:
+            results = self.reranker.rerank(query, results, self._rerank_top(top_k))
+        return results, skipped
+
+    def embed(self, query: str) -> List[float]:
+        """Encode a query, reusing the vector of an identical (normalized) question."""
+        key = normalize_question(query)
+        vector = self.embedding_cache.get(key)
+        if vector is None:
+            vector = self.model.encode(query).tolist()
+            self.embedding_cache.put(key, vector)
+        return vector
+
+    async def aembed(self, query: str) -> List[float]:
+        """Async twin of embed(): encoding runs on the dedicated embedding executor."""
+        key = normalize_question(query)
+        vector = self.embedding_cache.get(key)
+        if vector is None:
+            if self.embed_batcher is not None:
+                encoded = await self.embed_batcher.encode(query)
+            else:
+                loop = asyncio.get_running_loop()
+                encoded = await loop.run_in_executor(self._encode_executor, self.model.encode, query)
+            vector = encoded.tolist()
+            self.embedding_cache.put(key, vector)
+        return vector
+
+    async def asearch_with_status(
+        self,
+        query: str,
+        top_k: int = 4,
+        domain: Domain = "all",
+        vector: Optional[Sequence[float]] = None,
+    ) -> Tuple[List[Dict], Dict[str, str]]:
+        """Non-blocking search_with_status using the async Qdrant clients.
+
+        ``vector`` is the query embedding when the caller already has it (domain router,
+        semantic answer cache): the query is then not encoded again.
+        """
+        collections = self._target_collections(domain)
+        if not collections:
+            return [], {}
+
+        vector = await self.aembed(query) if vector is None else list(vector)
+        local, remote = self._split_local(collections)
+        pool = self._pool(top_k)
+        fetch_k = self._fetch_k(pool)
+        with_payload = not self._defer_payloads(remote, len(collections), pool)
+
+        outcomes = await self._agather(
+            (
+                asyncio.wait_for(
+                    self._asearch_one(collection, vector, fetch_k, with_payload), timeout=self.timeout
+                )
+                for collection in remote
+            )
+        )
+
+        hits_by_collection: Dict[str, list] = {}
+        skipped: Dict[str, str] = {}
+        for collection, outcome in zip(remote, outcomes):
+            if isinstance(outcome, BaseException):
+                skipped[collection] = self._failure_reason(collection, outcome)
+            else:
+                hits_by_collection[collection] = outcome
+        for collection in local:
+            hits_by_collection[collection] = self.local_indexes[collection].search(vector, fetch_k)
+        self._recover_locally(vector, fetch_k, hits_by_collection, skipped)
+
+        winners = self._select(collections, hits_by_collection, pool, query)
+        (winners,) = await self._ahydrate([winners], [skipped])
+        (results,) = await self._arerank([query], [self._format(winners)], [top_k])
+        return results, skipped
+
+    async def aembed_many(self, queries: Sequence[str]) -> List[List[float]]:
+        """Encode several queries with a single model.encode call (cache hits are skipped)."""
+        keys = [normalize_question(q) for q in queries]
+        vectors: List[Optional[List[float]]] = [self.embedding_cache.get(k) for k in keys]
+        missing: Dict[str, str] = {}
+        for key, query, vector in zip(keys, queries, vectors):
+            if vector is None and key not in missing:
+                missing[key] = query
+        if missing:
+            loop = asyncio.get_running_loop()
+            encoded = await loop.run_in_executor(
+                self._encode_executor, self.model.encode, list(missing.values())
+            )
+            fresh = {}
+            for key, row in zip(missing, encoded):
+                fresh[key] = row.tolist()
+                self.embedding_cache.put(key, fresh[key])
+            vectors = [v if v is not None else fresh[k] for k, v in zip(keys, vectors)]
+        return vectors
+
+    async def asearch_many(
+        self,
+        queries: Sequence[str],
+        top_ks: Sequence[int],
+        domains: Sequence[Domain],
+        vectors: Optional[Sequence[Sequence[float]]] = None,
+    ) -> List[Tuple[List[Dict], Dict[str, str]]]:
+        """Batched asearch_with_status: one search_batch request per collection for all queries.
+
+        ``vectors`` (one per query) skips the encode when the caller already embedded the queries.
+        """
+        if not self.available_collections or not queries:
+            return [([], {}) for _ in queries]
+
+        vectors = await self.aembed_many(queries) if vectors is None else [list(v) for v in vectors]
+        pools = [self._pool(top_k) for top_k in top_ks]
+        fetch_ks = [self._fetch_k(pool) for pool in pools]
+        targets: Dict[str, List[int]] = {}
+        for idx, domain in enumerate(domains):
+            for collection in self._target_collections(domain):
+                targets.setdefault(collection, []).append(idx)
+
+        local, remote = self._split_local(list(targets))
+        with_payload = not any(
+            self._defer_payloads(remote, len(self._target_collections(domain)), pool)
+            for domain, pool in zip(domains, pools)
+        )
+        outcomes = await self._agather(
+            (
+                asyncio.wait_for(
+                    self._asearch_batch(
+                        collection,
+                        [vectors[i] for i in targets[collection]],
+                        [fetch_ks[i] for i in targets[collection]],
+                        with_payload,
+                    ),
+                    timeout=self.timeout,
+                )
+                for collection in remote
+            )
+        )
+
+        per_item: List[Dict[str, list]] = [{} for _ in queries]
+        skipped: List[Dict[str, str]] = [{} for _ in queries]
+        for collection, outcome in zip(remote, outcomes):
+            indices = targets[collection]
+            if isinstance(outcome, BaseException):
+                reason = self._failure_reason(collection, outcome)
+                for idx in indices:
+                    skipped[idx][collection] = reason
+                continue
+            for idx, hits in zip(indices, outcome):
+                per_item[idx][collection] = hits
+        for collection in local:
+            for idx in targets[collection]:
+                per_item[idx][collection] = self.local_indexes[collection].search(vectors[idx], fetch_ks[idx])
+
+        winners = []
+        for idx in range(len(queries)):
+            self._recover_locally(vectors[idx], fetch_ks[idx], per_item[idx], skipped[idx])
+            winners.append(self._select(list(per_item[idx]), per_item[idx], pools[idx], queries[idx]))
+        # One retrieve per collection for the winners of every query.
+        winners = await self._ahydrate(winners, skipped)
+        # One cross-encoder batch for the candidates of every query.
+        results = await self._arerank(queries, [self._format(w) for w in winners], top_ks)
+        return list(zip(results, skipped))
+
+    def route_domains(self, vector: Sequence[float]) -> Optional[List[str]]:
+        """Collections a domain="all" query should search, or None to search them all."""
+        if self.router is None:
+            return None
+        return self.router.route(vector, self.available_collections)
+
+    async def abest_scores(
+        self, query: str, collections: Sequence[str], vector: Optional[Sequence[float]] = None
+    ) -> Dict[str, float]:
+        """Best dense (cosine) score of each collection: top-1 ids only, collections that fail are left out."""
+        targets = [c for c in collections if c in self.available_collections]
+        if not targets:
+            return {}
+        vector = await self.aembed(query) if vector is None else list(vector)
+        local, remote = self._split_local(targets)
+        outcomes = await self._agather(
+            (
+                asyncio.wait_for(self._asearch_one(collection, vector, 1, False), timeout=self.timeout)
+                for collection in remote
+            )
+        )
+        best: Dict[str, float] = {}
+        for collection, outcome in zip(remote, outcomes):
+            if isinstance(outcome, BaseException):
+                self._failure_reason(collection, outcome)
+            elif outcome:
+                best[collection] = float(outcome[0].score)
+        for collection in local:
+            hits = self.local_indexes[collection].search(vector, 1)
+            if hits:
+                best[collection] = float(hits[0].score)
+        return best
+
+    async def aclose(self) -> None:
+        for _, client in self._shared_clients.values():
+            try:
+                await client.close()
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.debug("Async Qdrant client close failed: %s", exc)
+
+    def stats(self) -> Dict:
+        return {
+            "embedding_cache": self.embedding_cache.stats(),
+            "embedding_backend": {"backend": self.model.backend, "model": self.model.name},
+            "embedding_batcher": self.embed_batcher.stats() if self.embed_batcher else {"enabled": False},
+            "qdrant_endpoints": {
+                "unique": len(self.endpoint_groups),
+                "collections": sum(len(c) for c in self.endpoint_groups.values()),
+                "grpc": PREFER_GRPC,
+            },
+            "local_index": {
+                "mode": self.local_mode,
+                "collections": {name: len(index) for name, index in self.local_indexes.items()},
+            },
+            "domain_router": self.router.stats() if self.router else {"enabled": False},
+            "reranker": self.reranker.stats() if self.reranker else {"enabled": False},
+            "hybrid": {
+                "enabled": self.hybrid,
+                "rrf_k": HYBRID_RRF_K,
+                "candidates": HYBRID_CANDIDATES,
+                "bm25_collections": sorted(self.sparse_indexes),
+            },
+        }
+
+    def _target_collections(self, domain: Domain) -> List[str]:
+        """A collection name, or a list of them (routed "all" query); unknown names mean every collection."""
+        available = self.available_collections
+        if isinstance(domain, str):
+            return [domain] if domain in available else available
+        return [c for c in domain if c in available] or available
 
-        if domain in self.clients:
-            collections = [domain]
+    def _split_local(self, collections: List[str]) -> Tuple[List[str], List[str]]:
+        """Collections answered from the local snapshot vs. those sent to Qdrant."""
+        local = [
+            c for c in collections
+            if c in self.local_indexes and (self.local_mode == "primary" or c not in self.clients)
+        ]
+        remote = [c for c in collections if c not in local and c in self.clients]
+        return local, remote
+
+    def _recover_locally(self, vector, top_k: int, hits_by_collection: Dict[str, list], skipped: Dict[str, str]):
+        """Fallback mode: answer collections Qdrant failed on from their local snapshot."""
+        for collection in list(skipped):
+            index = self.local_indexes.get(collection)
+            if index is None:
+                continue
+            logger.info("Serving %s from the local index (%s)", collection, skipped[collection])
+            hits_by_collection[collection] = index.search(vector, top_k)
+            del skipped[collection]
+
+    def _failure_reason(self, collection: str, exc: BaseException) -> str:
+        if isinstance(exc, asyncio.TimeoutError):
+            logger.warning("Qdrant search timed out for %s after %.1fs", collection, self.timeout)
+            return "timeout"
+        logger.warning("Qdrant search failed for %s: %s", collection, exc)
+        return f"error: {exc.__class__.__name__}"
+
+    def _pool(self, top_k: int) -> int:
+        """Global candidates kept before payloads are fetched: a deeper pool when they are reranked."""
+        return max(top_k, RERANK_CANDIDATES) if self.reranker is not None else top_k
+
+    @staticmethod
+    def _rerank_top(top_k: int) -> int:
+        return min(top_k, RERANK_TOP_K) if RERANK_TOP_K > 0 else top_k
+
+    async def _arerank(
+        self, queries: Sequence[str], result_lists: List[List[Dict]], top_ks: Sequence[int]
+    ) -> List[List[Dict]]:
+        if self.reranker is None:
+            return result_lists
+        loop = asyncio.get_running_loop()
+        # CPU-bound: own executor, so a large batch never holds up query encodes (EmbeddingBatcher).
+        return await loop.run_in_executor(
+            self._rerank_executor,
+            self.reranker.rerank_many,
+            list(queries),
+            result_lists,
+            [self._rerank_top(top_k) for top_k in top_ks],
+        )
+
+    def _fetch_k(self, top_k: int) -> int:
+        """Dense candidates per collection: a deeper pool when they are fused with BM25."""
+        return max(top_k, HYBRID_CANDIDATES) if self.hybrid else top_k
+
+    def _defer_payloads(self, remote: Sequence[str], n_collections: int, top_k: int) -> bool:
+        """Two-phase fetch pays off only when some remote candidates will be thrown away."""
+        return TWO_PHASE_FETCH and bool(remote) and self._fetch_k(top_k) * n_collections > top_k
+
+    def _select(
+        self,
+        collections: List[str],
+        hits_by_collection: Dict[str, list],
+        top_k: int,
+        query: Optional[str] = None,
+    ) -> List[Tuple[str, qm.ScoredPoint, Dict]]:
+        """Global top_k as ``(collection, hit, extra fields)``; remote payloads may still be missing."""
+        if self.hybrid and query is not None:
+            return self._fuse(collections, hits_by_collection, top_k, query)
+        ranked = self._ranked(collections, hits_by_collection)[:top_k]
+        if SCORE_NORMALIZATION in ("minmax", "zscore"):
+            return [(c, hit, {"norm_score": round(key, 6)}) for key, c, hit in ranked]
+        return [(c, hit, {}) for _, c, hit in ranked]
+
+    @staticmethod
+    def _ranked(collections: List[str], hits_by_collection: Dict[str, list]) -> List[Tuple]:
+        """Candidates of every collection sorted by their normalised score (RETRIEVER_SCORE_NORM)."""
+        candidates = [(c, hit) for c in collections for hit in hits_by_collection.get(c, [])]
+        if SCORE_NORMALIZATION == "minmax":
+            # One range for all collections: per collection, every collection's best hit would be 1.0,
+            # however weak, and tie with the best hit of the strongest collection.
+            keys = _normalize([hit.score for _, hit in candidates])
         else:
-            collections = list(self.clients.keys())
+            keys = [
+                key
+                for c in collections
+                for key in _normalize([hit.score for hit in hits_by_collection.get(c, [])])
+            ]
+        ranked = [(key, c, hit) for key, (c, hit) in zip(keys, candidates)]
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return ranked
+
+    def _fuse(
+        self, collections: List[str], hits_by_collection: Dict[str, list], top_k: int, query: str
+    ) -> List[Tuple[str, qm.ScoredPoint, Dict]]:
+        """Reciprocal rank fusion of the global dense ranking and the global BM25 ranking.
+
+        Only collections that answered the dense search contribute BM25 hits, so a
+        collection reported as skipped never shows up in the results.
+        """
+        answered = [c for c in collections if c in hits_by_collection]
+        tokens = tokenize(query)
+        fetch_k = self._fetch_k(top_k)
+        dense = [(c, hit) for _, c, hit in self._ranked(answered, hits_by_collection)]
+        sparse = [
+            (c, hit)
+            for c in answered
+            if c in self.sparse_indexes
+            for hit in self.sparse_indexes[c].search_sparse(tokens, fetch_k)
+        ]
+        sparse.sort(key=lambda item: item[1].score, reverse=True)
+        fused: Dict[Tuple[str, str], List] = {}
+        for ranking, field in ((dense, "dense_score"), (sparse, "sparse_score")):
+            for rank, (collection, hit) in enumerate(ranking):
+                key = (collection, str(hit.id))
+                entry = fused.setdefault(key, [collection, hit, {"score": 0.0}])
+                if entry[1].payload is None:
+                    entry[1] = hit  # BM25 hits come with their snapshot payload
+                entry[2]["score"] += 1.0 / (HYBRID_RRF_K + rank + 1)
+                entry[2][field] = hit.score
+        winners = sorted(fused.values(), key=lambda entry: entry[2]["score"], reverse=True)[:top_k]
+        return [tuple(entry) for entry in winners]
+
+    def _hydrate(self, winners: List[Tuple], skipped: Dict[str, str]) -> List[Tuple]:
+        """Phase 2 of the fetch: payloads of the winners, one retrieve per collection."""
+        fetched: Dict[str, Dict[str, Dict]] = {}
+        failed: Dict[str, str] = {}
+        for collection, ids in self._missing_payloads([winners]).items():
+            try:
+                fetched[collection] = self._retrieve(collection, ids)
+            except Exception as exc:
+                failed[collection] = self._failure_reason(collection, exc)
+        return self._attach(winners, fetched, failed, skipped)
+
+    async def _ahydrate(
+        self, winner_lists: List[List[Tuple]], skipped: List[Dict[str, str]]
+    ) -> List[List[Tuple]]:
+        missing = self._missing_payloads(winner_lists)
+        if not missing:
+            return winner_lists
+        collections = list(missing)
+        outcomes = await self._agather(
+            (
+                asyncio.wait_for(self._aretrieve(collection, missing[collection]), timeout=self.timeout)
+                for collection in collections
+            )
+        )
+        fetched: Dict[str, Dict[str, Dict]] = {}
+        failed: Dict[str, str] = {}
+        for collection, outcome in zip(collections, outcomes):
+            if isinstance(outcome, BaseException):
+                failed[collection] = self._failure_reason(collection, outcome)
+            else:
+                fetched[collection] = outcome
+        return [self._attach(w, fetched, failed, s) for w, s in zip(winner_lists, skipped)]
+
+    async def _agather(self, awaitables: Iterable[Awaitable]) -> List:
+        """Results (or exceptions) of ``awaitables`` in order: concurrent, or one by one if not ``parallel``."""
+        if self.parallel:
+            return await asyncio.gather(*awaitables, return_exceptions=True)
+        outcomes: List = []
+        for awaitable in awaitables:
+            try:
+                outcomes.append(await awaitable)
+            except Exception as exc:
+                outcomes.append(exc)
+        return outcomes
+
+    @staticmethod
+    def _missing_payloads(winner_lists: Sequence[List[Tuple]]) -> Dict[str, List]:
+        missing: Dict[str, Dict] = {}
+        for winners in winner_lists:
+            for collection, hit, _ in winners:
+                if hit.payload is None:
+                    missing.setdefault(collection, {})[hit.id] = None
+        return {collection: list(ids) for collection, ids in missing.items()}
+
+    @staticmethod
+    def _attach(
+        winners: List[Tuple], fetched: Dict, failed: Dict[str, str], skipped: Dict[str, str]
+    ) -> List[Tuple]:
+        """Winners with their payload; those of a collection whose retrieve failed are dropped."""
+        out = []
+        for collection, hit, extras in winners:
+            if hit.payload is None:
+                if collection in failed:
+                    skipped[collection] = failed[collection]
+                    continue
+                payload = fetched.get(collection, {}).get(str(hit.id))
+                if payload is None:  # deleted between the two phases
+                    continue
+                hit = qm.ScoredPoint(id=hit.id, version=hit.version, score=hit.score, payload=payload)
+            out.append((collection, hit, extras))
+        return out
+
+    def _format(self, winners: List[Tuple]) -> List[Dict]:
+        results: List[Dict] = []
+        for collection, hit, extras in winners:
+            result = self._format_hits(collection, [hit])[0]
+            result.update(extras)
+            results.append(result)
+        return results
+
+    def _retrieve(self, collection: str, ids: List) -> Dict[str, Dict]:
+        records = self.clients[collection].retrieve(
+            collection_name=collection,
+            ids=ids,
+            with_payload=PAYLOAD_SELECTOR,
+            with_vectors=False,
+            timeout=self._request_timeout,
+        )
+        return {str(record.id): record.payload or {} for record in records}
 
+    async def _aretrieve(self, collection: str, ids: List) -> Dict[str, Dict]:
+        records = await self.async_clients[collection].retrieve(
+            collection_name=collection,
+            ids=ids,
+            with_payload=PAYLOAD_SELECTOR,
+            with_vectors=False,
+            timeout=self._request_timeout,
+        )
+        return {str(record.id): record.payload or {} for record in records}
+
+    def _search_one(self, collection: str, vector: List[float], top_k: int, with_payload: bool = True):
+        return self.clients[collection].search(
+            collection_name=collection,
+            query_vector=vector,
+            limit=top_k,
+            with_payload=_payload(with_payload),
+            timeout=self._request_timeout,
+        )
+
+    async def _asearch_one(self, collection: str, vector: List[float], top_k: int, with_payload: bool = True):
+        return await self.async_clients[collection].search(
+            collection_name=collection,
+            query_vector=vector,
+            limit=top_k,
+            with_payload=_payload(with_payload),
+            timeout=self._request_timeout,
+        )
+
+    async def _asearch_batch(
+        self, collection: str, vectors: List[List[float]], limits: List[int], with_payload: bool = True
+    ):
+        return await self.async_clients[collection].search_batch(
+            collection_name=collection,
+            requests=[
+                qm.SearchRequest(vector=vector, limit=limit, with_payload=_payload(with_payload))
+                for vector, limit in zip(vectors, limits)
+            ],
+            timeout=self._request_timeout,
+        )
+
+    def _search_sequential(
+        self, collections: List[str], vector: List[float], top_k: int, with_payload: bool = True
+    ):
+        hits_by_collection: Dict[str, list] = {}
+        skipped: Dict[str, str] = {}
         for collection in collections:
-            client = self.clients.get(collection)
-            if client is None:
+            if collection not in self.clients:
                 continue
             try:
-                hits = client.search(
-                    collection_name=collection,
-                    query_vector=vector,
-                    limit=top_k,
-                )
+                hits_by_collection[collection] = self._search_one(collection, vector, top_k, with_payload)
             except Exception as exc:  # pragma: no cover - defensive
                 logger.warning("Qdrant search failed for %s: %s", collection, exc)
-                continue
+                skipped[collection] = f"error: {exc.__class__.__name__}"
+        return hits_by_collection, skipped
 
-            for hit in hits:
-                payload = hit.payload or {}
-                results.append(
-                    {
-                        "collection": collection,
-                        "score": hit.score,
-                        "text": payload.get("text", ""),
-                        "source": payload.get("source", ""),
-                        "title": payload.get("title", ""),
-                        "domain": payload.get("domain", ""),
-                    }
-                )
+    def _search_parallel(
+        self, collections: List[str], vector: List[float], top_k: int, with_payload: bool = True
+    ):
+        """Query every collection concurrently and keep whatever answers before the deadline."""
+        futures = {
+            self._executor.submit(self._search_one, collection, vector, top_k, with_payload): collection
+            for collection in collections
+            if collection in self.clients
+        }
+        done, not_done = wait(futures, timeout=self.timeout)
+
+        hits_by_collection: Dict[str, list] = {}
+        skipped: Dict[str, str] = {}
+        for future in done:
+            collection = futures[future]
+            try:
+                hits_by_collection[collection] = future.result()
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.warning("Qdrant search failed for %s: %s", collection, exc)
+                skipped[collection] = f"error: {exc.__class__.__name__}"
+        for future in not_done:
+            collection = futures[future]
+            future.cancel()
+            logger.warning("Qdrant search timed out for %s after %.1fs", collection, self.timeout)
+            skipped[collection] = "timeout"
+        return hits_by_collection, skipped
+
+    @staticmethod
+    def _format_hits(collection: str, hits) -> List[Dict]:
+        results: List[Dict] = []
+        for hit in hits:
+            payload = hit.payload or {}
+            if USE_SNIPPET and hit.payload is not None and TEXT_FIELD not in payload:
+                _warn_missing_snippet(collection)
+            result = {
+                "collection": collection,
+                "score": hit.score,
+                "text": payload.get(TEXT_FIELD, ""),
+                "source": payload.get("source", ""),
+                "title": payload.get("title", ""),
+                "domain": payload.get("domain", ""),
+            }
+            for key in CHUNK_METADATA:
+                if key in payload:
+                    result[key] = payload[key]
+            results.append(result)
+        return results
+
+
+_SNIPPET_WARNINGS: Set[str] = set()
+
+
+def _warn_missing_snippet(collection: str) -> None:
+    # Once per collection: its points predate --snippet-chars and come back with an empty text.
+    if collection not in _SNIPPET_WARNINGS:
+        _SNIPPET_WARNINGS.add(collection)
+        logger.warning(
+            "%s has points without 'snippet' (RETRIEVER_USE_SNIPPET=1): re-ingest it with "
+            "--snippet-chars N --no-manifest",
+            collection,
+        )
+
+
+def _payload(with_payload: bool):
+    return PAYLOAD_SELECTOR if with_payload else False
+
+
+def _normalize(scores: List[float]) -> List[float]:
+    """Score normalisation (RETRIEVER_SCORE_NORM) used to rank across collections.
 
-        return sorted(results, key=lambda item: item["score"], reverse=True)[:top_k]
+    ``minmax`` is applied to the candidates of all collections together (same order as the raw
+    cosine, scores in [0, 1]); ``zscore`` to each collection, to even out collections whose
+    cosine distributions differ.
+    """
+    if SCORE_NORMALIZATION == "minmax" and scores:
+        low, high = min(scores), max(scores)
+        return [(s - low) / (high - low) if high > low else 1.0 for s in scores]
+    if SCORE_NORMALIZATION == "zscore" and scores:
+        mean = sum(scores) / len(scores)
+        std = math.sqrt(sum((s - mean) ** 2 for s in scores) / len(scores))
+        return [(s - mean) / std if std else 0.0 for s in scores]
+    return scores
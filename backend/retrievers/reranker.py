@@ -0,0 +1,174 @@
+"""Optional cross-encoder reranking of the retrieved chunks.
+
+The retriever over-fetches ``RERANK_CANDIDATES`` chunks (cheap: ids and cosine
+scores), then a small cross-encoder scores every (question, chunk) pair in one
+batch and only the best ``RERANK_TOP_K`` go to the prompt. Scores are cached
+per (normalised question, hash of the scored text), so a repeated request only
+scores chunks it has not seen yet, and a chunk edited by a re-ingest is scored again.
+
+Backends, picked by ``RERANK_BACKEND`` (defaults to ``EMBEDDING_BACKEND``):
+
+- ``torch``: ``sentence_transformers.CrossEncoder``;
+- ``onnx``: ONNX Runtime on the int8 export written by
+  ``python -m retrievers.export_model --rerank --onnx`` (no torch import).
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from common.cache import LRUCache
+from common.embeddings import CONFIG_FILE, EMBEDDING_BACKEND, ONNX_MODEL_FILE, ONNX_THREADS, TOKENIZER_FILE
+from common.text import normalize_question
+
+# Multilingual (the corpus is mostly French) MiniLM cross-encoder trained on mMARCO.
+RERANK_MODEL = (os.getenv("RERANK_MODEL") or "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1").strip()
+RERANK_BACKEND = (os.getenv("RERANK_BACKEND") or EMBEDDING_BACKEND).strip().lower()
+# Optional local copy of RERANK_MODEL (torch backend), see retrievers/export_model.py --rerank.
+RERANK_MODEL_PATH = (os.getenv("RERANK_MODEL_PATH") or "").strip()
+RERANK_ONNX_PATH = (os.getenv("RERANK_ONNX_PATH") or "").strip() or str(
+    Path(__file__).resolve().parent.parent / "data" / "models" / "reranker-onnx"
+)
+# Question + chunk word pieces; a 1200-character French chunk is about 300 of them.
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "384"))
+
+Pair = Tuple[str, str]
+
+
+class CrossEncoderScorer:
+    """Reference backend: sentence-transformers CrossEncoder on PyTorch CPU."""
+
+    backend = "torch"
+
+    def __init__(self, path: Optional[str] = None, max_length: int = RERANK_MAX_LENGTH):
+        from sentence_transformers import CrossEncoder
+
+        self.name = RERANK_MODEL
+        self.model = CrossEncoder(path or RERANK_MODEL_PATH or RERANK_MODEL, max_length=max_length, device="cpu")
+
+    def predict(self, pairs: Sequence[Pair], batch_size: int = 32) -> np.ndarray:
+        return np.asarray(self.model.predict(list(pairs), batch_size=batch_size), dtype=np.float32).reshape(-1)
+
+
+class OnnxCrossEncoder:
+    """Cross-encoder logits from ONNX Runtime; pairs are tokenised with ``tokenizers``."""
+
+    backend = "onnx"
+
+    def __init__(self, path: Optional[str] = None, threads: Optional[int] = None):
+        import json
+
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = Path(path or RERANK_ONNX_PATH)
+        try:
+            config = json.loads((path / CONFIG_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            config = {}
+        self.name = f"{config.get('model', RERANK_MODEL)}@onnx-{config.get('weights', 'int8')}"
+
+        self.tokenizer = Tokenizer.from_file(str(path / TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=int(config.get("max_seq_length", RERANK_MAX_LENGTH)))
+        pad_token = config.get("pad_token", "<pad>")
+        pad_id = self.tokenizer.token_to_id(pad_token)
+        self.tokenizer.enable_padding(pad_id=pad_id if pad_id is not None else 0, pad_token=pad_token)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = ONNX_THREADS if threads is None else threads
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            str(path / config.get("model_file", ONNX_MODEL_FILE)), options, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def predict(self, pairs: Sequence[Pair], batch_size: int = 32) -> np.ndarray:
+        out = np.empty(len(pairs), dtype=np.float32)
+        for start in range(0, len(pairs), batch_size):
+            encodings = self.tokenizer.encode_batch(list(pairs[start:start + batch_size]))
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            }
+            if "token_type_ids" in self._inputs:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            logits = self.session.run(None, feeds)[0]
+            out[start:start + len(encodings)] = logits[:, 0] if logits.ndim == 2 else logits
+        return out
+
+
+def load_scorer(backend: Optional[str] = None, path: Optional[str] = None):
+    backend = (backend or RERANK_BACKEND).lower()
+    if backend == "onnx":
+        return OnnxCrossEncoder(path)
+    if backend == "torch":
+        return CrossEncoderScorer(path)
+    raise ValueError(f"Unknown rerank backend: {backend!r} (expected 'torch' or 'onnx')")
+
+
+class Reranker:
+    def __init__(self, scorer, cache_size: int = 4096, cache_ttl: Optional[float] = None, batch_size: int = 32):
+        self.scorer = scorer
+        self.cache = LRUCache(cache_size, ttl=cache_ttl)
+        self.batch_size = max(1, int(batch_size))
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.scored_pairs = 0
+
+    def rerank(self, query: str, contexts: List[Dict], top_n: int) -> List[Dict]:
+        return self.rerank_many([query], [contexts], [top_n])[0]
+
+    def rerank_many(
+        self, queries: Sequence[str], context_lists: Sequence[List[Dict]], top_ns: Sequence[int]
+    ) -> List[List[Dict]]:
+        """Best ``top_n`` contexts of each list by cross-encoder score, all new pairs scored in one batch."""
+        keys = [[_pair_key(q, ctx) for ctx in contexts] for q, contexts in zip(queries, context_lists)]
+        scores: Dict[Hashable, float] = {}
+        missing: Dict[Hashable, Pair] = {}
+        for query, contexts, row in zip(queries, context_lists, keys):
+            for ctx, key in zip(contexts, row):
+                if key in scores or key in missing:
+                    continue
+                cached = self.cache.get(key)
+                if cached is None:
+                    missing[key] = (query, ctx.get("text", ""))
+                else:
+                    scores[key] = cached
+        if missing:
+            predicted = self.scorer.predict(list(missing.values()), batch_size=self.batch_size)
+            with self._lock:
+                self.calls += 1
+                self.scored_pairs += len(missing)
+            for key, score in zip(missing, predicted):
+                scores[key] = float(score)
+                self.cache.put(key, float(score))
+
+        out: List[List[Dict]] = []
+        for contexts, row, top_n in zip(context_lists, keys, top_ns):
+            rescored = [{**ctx, "rerank_score": round(scores[key], 6)} for ctx, key in zip(contexts, row)]
+            rescored.sort(key=lambda ctx: ctx["rerank_score"], reverse=True)
+            out.append(rescored[: max(0, top_n)])
+        return out
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls, pairs = self.calls, self.scored_pairs
+        return {
+            "backend": self.scorer.backend,
+            "model": self.scorer.name,
+            "model_calls": calls,
+            "scored_pairs": pairs,
+            "score_cache": self.cache.stats(),
+        }
+
+
+def _pair_key(query: str, ctx: Dict) -> Tuple:
+    # The score is a function of the question and the scored text only: keying on the text
+    # (not on doc_id/chunk_id) means a chunk edited in place by a re-ingest is never served stale.
+    digest = hashlib.sha1((ctx.get("text") or "").encode("utf-8")).digest()
+    return normalize_question(query), digest
@@ -1,9 +1,10 @@
 # UI refined
 """Streamlit front-end for FarmLink Copilot."""
+import json
 import os
 from copy import deepcopy
 from html import escape
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
 
 import requests
 import streamlit as st
@@ -408,6 +409,51 @@ def render_source_card(ctx: Dict, index: int) -> str:
     )
 
 
+def iter_sse(response: requests.Response) -> Iterator[Tuple[str, Dict]]:
+    """Parse a Server-Sent Events body into (event, data) pairs."""
+    event, data_lines = "message", []
+    for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data_lines:
+                try:
+                    yield event, json.loads("\n".join(data_lines))
+                except ValueError:
+                    pass
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
+def stream_answer(payload: Dict, placeholder) -> Tuple[str, List[Dict]]:
+    """Call /query/stream and render the answer incrementally in ``placeholder``."""
+    answer, contexts = "", []
+    with requests.post(
+        f"{API_URL}/query/stream",
+        json=payload,
+        stream=True,
+        timeout=(10, 60),
+    ) as response:
+        response.raise_for_status()
+        for event, data in iter_sse(response):
+            if event == "contexts":
+                contexts = data.get("contexts") or []
+            elif event in ("token", "sources"):
+                answer += data.get("text", "")
+                placeholder.markdown(answer + "▌")
+            elif event == "done":
+                answer = data.get("answer") or answer
+            elif event == "error":
+                # Generation cut mid-stream: keep what arrived, flag it as incomplete.
+                answer = (data.get("partial_answer") or answer).rstrip()
+                answer += f"\n\n⚠️ {data.get('detail') or 'Réponse incomplète.'}"
+    placeholder.markdown(answer or "Pas de réponse disponible pour le moment.")
+    return answer, contexts if isinstance(contexts, list) else []
+
+
 def ensure_state() -> None:
     """Make sure session state keys exist."""
     if "messages" not in st.session_state:
@@ -504,56 +550,21 @@ def main() -> None:
         )
         submitted = st.form_submit_button("Interroger FarmLink", use_container_width=True)
 
+    pending_payload = None
     if submitted:
         question = (prompt or "").strip()
         if not question:
             st.warning("Merci de saisir une question avant d'envoyer.")
         else:
             st.session_state.messages.append({"role": "user", "content": question})
-            payload = {
+            pending_payload = {
                 "question": question,
                 "domain": st.session_state.selected_domain,
                 "top_k": int(st.session_state.top_k_value),
                 "temperature": float(st.session_state.temperature_value),
+                # Source cards only show a short excerpt: no need to download whole chunks.
+                "context_chars": 240,
             }
-            try:
-                with st.spinner("Analyse des ressources FarmLink…"):
-                    response = requests.post(
-                        f"{API_URL}/query",
-                        json=payload,
-                        timeout=60,
-                    )
-                    response.raise_for_status()
-                    data = response.json()
-            except requests.Timeout:
-                st.session_state.messages.append(
-                    {
-                        "role": "assistant",
-                        "content": "La requête a expiré. Merci de réessayer dans quelques instants.",
-                    }
-                )
-                st.session_state.contexts = []
-            except requests.RequestException as exc:
-                st.session_state.messages.append(
-                    {
-                        "role": "assistant",
-                        "content": f"Impossible d'interroger l'API FarmLink : {exc}.",
-                    }
-                )
-                st.session_state.contexts = []
-            except ValueError:
-                st.session_state.messages.append(
-                    {
-                        "role": "assistant",
-                        "content": "La réponse du serveur n'est pas au format JSON attendu.",
-                    }
-                )
-                st.session_state.contexts = []
-            else:
-                answer = data.get("answer") or "Pas de réponse disponible pour le moment."
-                st.session_state.messages.append({"role": "assistant", "content": answer})
-                contexts = data.get("contexts")
-                st.session_state.contexts = contexts if isinstance(contexts, list) else []
 
     with chat_placeholder:
         for message in st.session_state.messages:
@@ -561,6 +572,24 @@ def main() -> None:
             with st.chat_message(message["role"], avatar=avatar):
                 st.markdown(message["content"])
 
+        if pending_payload is not None:
+            with st.chat_message("assistant", avatar="🌿"):
+                answer_placeholder = st.empty()
+                try:
+                    answer_placeholder.markdown("Analyse des ressources FarmLink…")
+                    answer, contexts = stream_answer(pending_payload, answer_placeholder)
+                except requests.Timeout:
+                    answer = "La requête a expiré. Merci de réessayer dans quelques instants."
+                    contexts = []
+                    answer_placeholder.markdown(answer)
+                except requests.RequestException as exc:
+                    answer = f"Impossible d'interroger l'API FarmLink : {exc}."
+                    contexts = []
+                    answer_placeholder.markdown(answer)
+                answer = answer or "Pas de réponse disponible pour le moment."
+            st.session_state.messages.append({"role": "assistant", "content": answer})
+            st.session_state.contexts = contexts
+
     with sources_placeholder:
         if st.session_state.contexts:
             st.markdown("<div class='section-title'>Sources mobilisées</div>", unsafe_allow_html=True)